@@ -1,88 +1,186 @@
 #实时监控 EVE Online 的游戏日志文件，解析攻击事件。
+import logging
 import os
 import time
-import re
 import threading
+from collections import Counter
+from checkpoint_store import CheckpointStore, file_identity
+from log_parser import CombatLineParser
+from log_index import GamelogIndex, create_directory_watcher
+from log_tailer import LineReader, create_watcher
+
+logger = logging.getLogger(__name__)
 
 class EVELogMonitor:
-    def __init__(self, config, callback):
+    def __init__(self, config, callback, batch_callback=None):
         self.config = config
-        self.callback = callback
+        self.callback = callback  # 每个事件调用一次
+        self.batch_callback = batch_callback  # 设置后改为每次读取调用一次，参数为事件列表
         self.running = False
         self.thread = None
+        self.index = None
+        self.log_file = None
+        self.parser = CombatLineParser(config)
+        self.checkpoints = CheckpointStore(interval=config.get("checkpoint_interval", 1.0))
+        self.latency = None  # LatencyTracker，开启后记录每批日志行被读到的时间
+        self.profiler = None  # RuntimeProfiler，在日志线程的循环中开启/停止 cProfile
+        # 供 /metrics 读取的计数器，只在日志线程中修改
+        self.lines_read = 0
+        self.read_errors = 0
+        self.event_counts = Counter()  # (事件类型, 子类型) -> 数量
+        self.wait_timeout = 0.5  # 无新内容时单次等待的最长时间，决定 stop() 的响应速度
 
     def find_latest_log_file(self):
         log_dir = self.config["log_dir"]
         if not os.path.exists(log_dir):
-            print(f"日志目录不存在: {log_dir}")
+            logger.warning("日志目录不存在: %s", log_dir)
             return None
-        log_files = [f for f in os.listdir(log_dir) if f.endswith(".txt")]
-        if not log_files:
-            print(f"未找到日志文件在: {log_dir}")
+        self.index = self._load_index(log_dir)
+        listener_id = self.config.get("listener_id")
+        # 多开时只选择当前配置角色的日志
+        latest_file = self.index.latest(listener_id or None)
+        self.index.save()
+        if not latest_file:
+            if listener_id:
+                logger.warning("未找到角色 %s 的日志文件在: %s", listener_id, log_dir)
+            else:
+                logger.warning("未找到日志文件在: %s", log_dir)
             return None
-        latest_file = max(log_files, key=lambda f: os.path.getctime(os.path.join(log_dir, f)))
-        return os.path.join(log_dir, latest_file)
+        return latest_file
+
+    def _load_index(self, log_dir):
+        index = GamelogIndex(log_dir)
+        index.load()
+        index.refresh()
+        index.save()
+        return index
 
     def start(self, log_file):
         self.running = True
         self.thread = threading.Thread(target=self._monitor, args=(log_file,), daemon=True)
         self.thread.start()
-        print(f"开始监控日志文件: {log_file}")
+        logger.info("开始监控日志文件: %s", log_file)
 
     def _monitor(self, log_file):
-        last_position = 0
-        with open(log_file, "r", encoding="utf-8") as f:
-            f.seek(0, os.SEEK_END)
-            last_position = f.tell()
-        while self.running:
-            try:
-                with open(log_file, "r", encoding="utf-8") as f:
-                    f.seek(last_position)
-                    new_lines = f.readlines()
-                    last_position = f.tell()
-                    for line in new_lines:
-                        event = self.parse_line(line)
-                        if event:
-                            print(f"解析到事件: {event}")
-                            self.callback(event)
-            except Exception as e:
-                print(f"读取日志文件时出错: {e}")
-            time.sleep(0.1)
+        if self.index is None or self.index.log_dir != os.path.dirname(log_file):
+            self.index = self._load_index(os.path.dirname(log_file))
+        dir_watcher = create_directory_watcher(self.index.log_dir)
+        self.checkpoints.load()
+        seek_end = True
+        try:
+            # 游戏开启新会话时 _tail 返回新的日志文件，从头开始读取
+            while self.running and log_file:
+                log_file = self._tail(log_file, seek_end, dir_watcher)
+                seek_end = False
+        finally:
+            dir_watcher.close()
+            self.index.save()
+            self.checkpoints.save()
 
-    def stop(self):
-        self.running = False
-        if self.thread:
-            self.thread.join()
-        print("日志监控已停止")
+    def _tail(self, log_file, seek_end, dir_watcher):
+        self.log_file = log_file
+        # 保持文件句柄常开，只在收到变化通知后读取新增内容
+        with open(log_file, "rb", buffering=0) as f:
+            identity = file_identity(os.fstat(f.fileno()))
+            resume_offset = self._resume_offset(log_file) if seek_end else None
+            if resume_offset is not None:
+                # 从上次消费到的位置继续，重启期间写入的内容一次性补读
+                f.seek(resume_offset)
+            elif seek_end:
+                f.seek(0, os.SEEK_END)
+            reader = LineReader(f)
+            if resume_offset is not None:
+                self._catch_up(reader.read_lines())
+            self.checkpoints.update(log_file, identity, reader.offset)
+            watcher = create_watcher(log_file)
+            try:
+                while self.running:
+                    if self.profiler is not None:
+                        self.profiler.poll()
+                    try:
+                        new_lines = reader.read_lines()
+                        if new_lines:
+                            self.lines_read += len(new_lines)
+                            latency = self.latency
+                            detected = latency.clock() if latency is not None and latency.enabled else None
+                            self._dispatch(new_lines, detected)
+                            self.checkpoints.update(log_file, identity, reader.offset)
+                        self.checkpoints.maybe_save()
+                        if not new_lines:
+                            next_file = self._check_rollover(log_file, dir_watcher)
+                            if next_file:
+                                logger.info("检测到新的日志会话，切换到: %s", next_file)
+                                return next_file
+                            watcher.wait(self.wait_timeout)
+                    except Exception as e:
+                        self.read_errors += 1
+                        logger.error("读取日志文件时出错: %s", e)
+                        time.sleep(0.1)
+            finally:
+                watcher.close()
+        return None
 
-    def parse_line(self, line):
-        line = line.strip()
-        if "(combat)" not in line.lower():
+    def _resume_offset(self, log_file):
+        if not self.config.get("resume_enabled", True):
             return None
+        # 太久之前的内容不再补读，避免重启后突然收到大量过时的事件
+        return self.checkpoints.resume_offset(log_file, self.config.get("resume_max_age", 120))
 
-        attack_patterns = {
-            "强力一击": r"(强力一击|Critical Hit)",
-            "命中": r"(命中|Hit)",
-            "穿透": r"(穿透|Penetrates)",
-            "擦过": r"(擦过|Glances)",
-            "轻轻擦过": r"(轻轻擦过|Lightly Hits)",
-            "完全没有打中你": r"(完全没有打中你|Misses Completely)",
-            "致命一击": r"(致命一击|Wrecks)"
-        }
+    def _catch_up(self, lines):
+        """补读的内容整体解析后一次交给批量回调，不逐行输出"""
+        if not lines:
+            return
+        self.lines_read += len(lines)
+        events = [event for event in map(self.parse_line, lines) if event]
+        self.event_counts.update((event.type, event.subtype) for event in events)
+        logger.info("从上次位置续读 %d 行，解析到 %d 个事件", len(lines), len(events))
+        if not events:
+            return
+        if self.batch_callback is not None:
+            self.batch_callback(events)
+        else:
+            for event in events:
+                self.callback(event)
 
-        for attack_type, pattern in attack_patterns.items():
-            match = re.search(r"<color=0xff00ffff>.*?<font size=10>对</font>.*?- " + pattern, line, re.IGNORECASE)
-            if match and attack_type in self.config["monitored_reward_types"]:
-                return {"type": "player_attack", "subtype": attack_type}
+    def _dispatch(self, lines, detected=None):
+        if self.batch_callback is not None:
+            events = [event for event in map(self.parse_line, lines) if event]
+            if events:
+                self.event_counts.update((event.type, event.subtype) for event in events)
+                logger.debug("解析到 %d 个事件", len(events))
+                if detected is not None:
+                    self.latency.parsed(detected)
+                self.batch_callback(events)
+            return
+        for line in lines:
+            event = self.parse_line(line)
+            if event:
+                if detected is not None:
+                    self.latency.parsed(detected)
+                    detected = None
+                self.event_counts[event.type, event.subtype] += 1
+                logger.debug("解析到事件: %s", event)
+                self.callback(event)
 
-            match = re.search(r"<color=0xffcc0000>.*?<font size=10>来自</font>.*?- " + pattern, line, re.IGNORECASE)
-            if match and attack_type in self.config["monitored_damage_types"]:
-                return {"type": "damage", "subtype": attack_type}
-
-        if "完全没有打中你" in line and "完全没有打中你" in self.config["monitored_damage_types"]:
-            return {"type": "damage", "subtype": "完全没有打中你"}
+    def _check_rollover(self, log_file, dir_watcher):
+        """目录中出现其他文件的变化时查找同一角色更新的日志文件"""
+        changed = dir_watcher.poll(self.index)
+        if not changed - {os.path.basename(log_file)}:
+            return None
+        listener_id = self.config.get("listener_id")
+        if not listener_id:
+            listener_id = self.index.listener_of(os.path.basename(log_file)) or None
+        latest_file = self.index.latest(listener_id)
+        if latest_file and latest_file != log_file:
+            self.index.save()
+            return latest_file
+        return None
 
-        if "你的" in line and "完全没有打中" in line and "完全没有打中你" in self.config["monitored_reward_types"]:
-            return {"type": "player_attack", "subtype": "完全没有打中你"}
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join()
+        logger.info("日志监控已停止")
 
-        return None
+    def parse_line(self, line):
+        return self.parser.parse(line)
@@ -0,0 +1,51 @@
+#程序运行日志：按级别过滤、参数延迟格式化，写入滚动文件、控制台和界面的工作在后台线程中完成。
+import logging
+import logging.handlers
+import queue
+import sys
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+_queue_handler = None
+_listener = None
+
+
+def setup_logging(level="INFO", log_file="eve_otc.log", max_bytes=1024 * 1024, backup_count=3, extra_handlers=()):
+    """根日志器只挂一个 QueueHandler，调用方只把记录放进队列；低于 level 的记录在调用处直接丢弃，不做格式化"""
+    global _queue_handler, _listener
+    shutdown_logging()
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = [logging.StreamHandler(sys.stdout)]
+    if log_file:
+        handlers.append(logging.handlers.RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backup_count,
+                                                             encoding="utf-8"))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    handlers.extend(extra_handlers)
+
+    log_queue = queue.SimpleQueue()
+    _queue_handler = logging.handlers.QueueHandler(log_queue)
+    root = logging.getLogger()
+    root.addHandler(_queue_handler)
+    set_level(level)
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def set_level(level):
+    """运行中调整级别，例如排查问题时临时切换到 DEBUG"""
+    logging.getLogger().setLevel(level.upper() if isinstance(level, str) else level)
+
+
+def shutdown_logging():
+    """停止后台线程，写完队列中剩余的记录"""
+    global _queue_handler, _listener
+    if _listener:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+    if _queue_handler:
+        logging.getLogger().removeHandler(_queue_handler)
+        _queue_handler = None
@@ -0,0 +1,85 @@
+#日志读取位置检查点：按文件路径记录已消费的字节偏移和 inode 指纹，批量、原子地写入磁盘。
+import json
+import logging
+import os
+import time
+from config_store import write_atomic
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_FILE = "gamelog_checkpoint.json"
+MAX_ENTRIES = 32  # 只保留最近的若干个日志文件
+HEARTBEAT = 30.0  # 秒，没有新内容时也按该间隔写盘刷新时间，异常退出后据此判断停了多久
+
+
+def file_identity(st):
+    """由 os.stat / os.fstat 结果得到 (设备号, inode)，文件被替换或重建后会变化"""
+    return st.st_dev, st.st_ino
+
+
+class CheckpointStore:
+    def __init__(self, checkpoint_file=CHECKPOINT_FILE, interval=1.0):
+        self.checkpoint_file = checkpoint_file
+        self.interval = interval  # 两次写盘的最短间隔，期间的更新只保存在内存中
+        self.entries = {}  # 路径 -> {"dev", "ino", "offset", "time"}，time 为最后一次确认仍在读取该文件的时间
+        self.active = None  # 正在读取的文件，写盘时刷新它的 time
+        self.dirty = False
+        self.last_save = 0.0
+        self.writes = 0
+
+    def load(self):
+        try:
+            if os.path.exists(self.checkpoint_file):
+                with open(self.checkpoint_file, "r", encoding="utf-8") as f:
+                    self.entries = json.load(f).get("files", {})
+        except Exception as e:
+            logger.warning("加载读取位置失败: %s", e)
+            self.entries = {}
+
+    def update(self, path, identity, offset):
+        """记录已消费到 offset；只修改内存，由 maybe_save / save 批量写盘"""
+        key = os.path.abspath(path)
+        self.active = key
+        entry = self.entries.get(key)
+        if entry is not None and entry["offset"] == offset and (entry["dev"], entry["ino"]) == identity:
+            return
+        self.entries[key] = {"dev": identity[0], "ino": identity[1], "offset": offset, "time": time.time()}
+        self.dirty = True
+
+    def resume_offset(self, path, max_age=None):
+        """返回可以续读的偏移；没有记录、文件已被替换或截断、记录超过 max_age 秒时返回 None"""
+        entry = self.entries.get(os.path.abspath(path))
+        if entry is None:
+            return None
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        if (entry["dev"], entry["ino"]) != file_identity(st) or entry["offset"] > st.st_size:
+            return None
+        if max_age is not None and time.time() - entry["time"] > max_age:
+            return None
+        return entry["offset"]
+
+    def maybe_save(self):
+        elapsed = time.monotonic() - self.last_save
+        if elapsed >= (self.interval if self.dirty else HEARTBEAT):
+            self.save()
+
+    def save(self):
+        """写盘并把正在读取的文件的 time 刷新为现在；停止时调用，使续读的时效从退出时开始计算"""
+        entry = self.entries.get(self.active)
+        if entry is not None:
+            entry["time"] = time.time()
+        elif not self.dirty:
+            return
+        if len(self.entries) > MAX_ENTRIES:
+            newest = sorted(self.entries.items(), key=lambda item: item[1]["time"], reverse=True)
+            self.entries = dict(newest[:MAX_ENTRIES])
+        try:
+            write_atomic(self.checkpoint_file, json.dumps({"files": self.entries}, ensure_ascii=False))
+            self.dirty = False
+            self.writes += 1
+        except Exception as e:
+            logger.error("保存读取位置失败: %s", e)
+        self.last_save = time.monotonic()
@@ -1,47 +1,97 @@
+#界面和无界面运行共用的配置：默认值、读取 otc_config.json、校验和保存。只依赖标准库，启动时导入开销很小。
+import copy
 import json
+import logging
 import os
-from config import validate_config
+
+logger = logging.getLogger(__name__)
 
 CONFIG_FILE = "otc_config.json"
+WS_PORT_PATH = ":60536/1"  # 只填写 IP 时补全的端口和路径
 
-def load_config():
-    default_config = {
-        "ws": "ws://192.168.8.129:60536/1",
-        "log_dir": os.path.expanduser(r"~\Documents\EVE\logs\Gamelogs"),  # 动态获取用户目录
-        "listener_id": "YOUR_LISTENER_ID",  # 请替换为实际ID
-        "base_intensity": 20,
-        "app_max_intensity": 30,
-        "A_max": 30,
-        "B_max": 30,
-        "damage_types": {
-            "强力一击": 10, "命中": 8, "穿透": 10, "擦过": 5, "轻轻擦过": 5, "完全没有打中你": 5
-        },
-        "reward_types": {
-            "强力一击": 10, "命中": 8, "穿透": 10, "擦过": 5, "轻轻擦过": 5, "完全没有打中你": 5
-        },
-        "monitored_damage_types": ["强力一击", "命中", "穿透", "擦过", "轻轻擦过", "完全没有打中你"],
-        "monitored_reward_types": ["强力一击", "命中", "穿透"],
-        "selected_patterns": ["经典"],
-        "waveform_enabled": False,
-        "min_intensity": 0,
-        "max_intensity": 30,
-        "channel": "both",
-        "ticks": 10,
-        "history_ids": []
-    }
-    try:
-        if os.path.exists(CONFIG_FILE):
-            with open(CONFIG_FILE, "r", encoding="utf-8") as f:
-                loaded_config = json.load(f)
-                default_config.update(loaded_config)
-    except Exception as e:
-        print(f"加载配置失败: {e}")
-    validate_config(default_config)  # 验证配置
-    return default_config
+DEFAULT_CONFIG = {
+    "ws_ip": "",  # 只存 IP 部分
+    "ws": "",     # 完整的 WebSocket URL，填写了 ws_ip 时由 ws_ip 生成
+    "log_dir": "",
+    "listener_id": "",
+    "base_intensity": 0,
+    "app_max_intensity": None,  # 初始为 None，表示未获取
+    "A_max": None,              # 初始为 None
+    "B_max": None,              # 初始为 None
+    "damage_types": {
+        "强力一击": 10, "命中": 8, "穿透": 10, "擦过": 5, "轻轻擦过": 5, "完全没有打中你": 5
+    },
+    "reward_types": {
+        "强力一击": 10, "命中": 8, "穿透": 10, "擦过": 5, "轻轻擦过": 5, "完全没有打中你": 5
+    },
+    "monitored_damage_types": [],
+    "monitored_reward_types": [],
+    "selected_patterns": ["经典"],
+    "waveform_enabled": False,
+    "min_intensity": 0,
+    "max_intensity": 30,  # 仅用于显示默认值
+    "channel": "both",
+    "channel_settings": {"A": {}, "B": {}},  # 通道单独的配置，如 {"A": {"events": ["damage"]}}
+    "ticks": 10,
+    "decay_mode": "event",  # "event" 每个事件衰减 10%（原有行为），"time" 按时间衰减，需要时手动开启
+    "decay_half_life": 10.0,  # 秒
+    "event_buffer_size": 256,
+    "stats_window": 10,  # 秒
+    "intensity_mode": "weights",  # "weights" 按命中类型权重，"dps" 按滑动窗口内的 DPS
+    "dps_window": 10,  # 秒
+    "dps_curve": "sqrt",  # "linear" / "sqrt" / "log"
+    "dps_full_scale": 300,  # 受到的 DPS 达到该值时为满强度
+    "dps_outgoing_full_scale": 1000,
+    "dps_outgoing_weight": 0.25,  # 造成的 DPS 最多降低上限的该比例
+    "resume_enabled": True,  # 重启后从上次读取的位置继续
+    "resume_max_age": 120,  # 秒，上次位置超过该时间则从文件末尾开始
+    "checkpoint_interval": 1.0,  # 秒，读取位置的写盘间隔
+    "event_queue_size": 1024,
+    "event_queue_overflow": "drop_oldest",  # 或 "drop_newest"
+    "waveform_rate": 5,  # Hz，波形调度频率，建议 2-10
+    "max_send_rate": 10,  # 每秒最多发送的波形指令数
+    "send_deadband": 5,  # 百分点，强度下降小于该值时不立即发送，等保活时一起发出
+    "frame_cache_size": 512,
+    "ping_interval": 1.0,  # 秒，心跳间隔
+    "ping_timeout": 1.0,  # 秒，超时未收到 pong 视为断线并重连
+    "request_timeout": 3.0,  # 秒，等待 App 回复的超时
+    "rules": [],  # 声明式规则，如 {"name": "跃迁扰断", "category": "combat", "keywords": ["Warp scramble attempt"], "type": "damage", "weight": 20}
+    "log_view_lines": 1000,  # 日志窗口保留的最大行数
+    "log_flush_interval": 200,  # 毫秒，日志窗口的刷新间隔
+    "log_level": "INFO",  # 设为 "DEBUG" 输出逐事件、逐指令的调试日志
+    "log_file": "eve_otc.log",
+    "log_max_bytes": 1048576,
+    "log_backup_count": 3,
+    "latency_tracking": False,  # 记录端到端延迟，可在界面上随时开关
+    "latency_dump_file": "latency.json",
+    "metrics_enabled": False,  # 在 127.0.0.1 上提供 /metrics 和性能分析接口
+    "metrics_port": 9464,
+    "profile_dir": "profiles",  # cProfile / tracemalloc 结果的输出目录
+    "history_ids": []
+}
 
-def save_config(config):
+def load_config(path=CONFIG_FILE):
+    """返回默认值与配置文件合并后的配置；不做校验，界面中可以之后再填写"""
+    config = copy.deepcopy(DEFAULT_CONFIG)
     try:
-        with open(CONFIG_FILE, "w", encoding="utf-8") as f:
-            json.dump(config, f, ensure_ascii=False, indent=4)
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                config.update(json.load(f))
     except Exception as e:
-        print(f"保存配置失败: {e}")
+        logger.error("加载配置失败: %s", e)
+    return config
+
+def websocket_url(config):
+    if config.get("ws_ip"):
+        return f"ws://{config['ws_ip']}{WS_PORT_PATH}"  # 自动补全
+    return config.get("ws", "")
+
+def validate_config(config):
+    if not websocket_url(config):
+        raise ValueError("WebSocket IP 不能为空")
+    if not config["log_dir"] or not os.path.exists(config["log_dir"]):
+        raise ValueError(f"日志目录无效或不存在: {config['log_dir']}")
+    if not config["listener_id"]:
+        raise ValueError("游戏ID 不能为空")
+    if config["base_intensity"] < 0:
+        raise ValueError("基础强度必须为非负整数")
@@ -0,0 +1,98 @@
+#配置持久化：短时间内的多次修改合并为一次，由后台线程原子写入，内容未变化时不写盘。
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def dump_config(config):
+    return json.dumps(config, ensure_ascii=False, indent=4)
+
+
+def write_atomic(path, text):
+    """先写临时文件再替换，写到一半崩溃也不会留下被截断的文件"""
+    tmp_file = path + ".tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, path)
+
+
+class ConfigStore:
+    def __init__(self, config, path, delay=0.5):
+        self.config = config
+        self.path = path
+        self.delay = delay  # 最后一次修改后等待的秒数，期间的修改合并写入
+        self.condition = threading.Condition()
+        self.pending = None  # 等待写入的内容
+        self.deadline = 0.0
+        self.latest = dump_config(config)  # 最近一次提交的内容，用于跳过没有变化的保存
+        self.written = None  # 已经写入磁盘的内容
+        self.writes = 0
+        self.skipped = 0
+        self.last_error = None
+        self.closed = False
+        self.thread = threading.Thread(target=self._worker, daemon=True)
+        self.thread.start()
+
+    def save(self):
+        """在调用线程中只做序列化，写盘交给后台线程；内容与上次相同时直接返回"""
+        text = dump_config(self.config)
+        with self.condition:
+            if text == self.latest:
+                self.skipped += 1
+                return False
+            self.latest = text
+            self.pending = text
+            self.deadline = time.monotonic() + self.delay
+            self.condition.notify()
+        return True
+
+    def flush(self, timeout=2.0):
+        """立即写入尚未保存的内容并等待完成，用于退出前"""
+        with self.condition:
+            self.deadline = 0.0
+            self.condition.notify_all()
+            return self.condition.wait_for(lambda: self.pending is None, timeout)
+
+    def close(self):
+        self.flush()
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.thread.join(1.0)
+
+    def _worker(self):
+        while True:
+            with self.condition:
+                while self.pending is None and not self.closed:
+                    self.condition.wait()
+                if self.pending is None:
+                    return
+                remaining = self.deadline - time.monotonic()
+                if remaining > 0:
+                    # 还在连续修改中，等到最后一次修改之后 delay 秒再写
+                    self.condition.wait(remaining)
+                    continue
+                text = self.pending
+            self._write(text)
+            with self.condition:
+                if self.pending is text:
+                    self.pending = None
+                self.condition.notify_all()
+
+    def _write(self, text):
+        if text == self.written:
+            return
+        try:
+            write_atomic(self.path, text)
+            self.written = text
+            self.writes += 1
+            self.last_error = None
+        except Exception as e:
+            self.last_error = e
+            logger.error("保存配置失败: %s", e)
@@ -0,0 +1,72 @@
+#日志线程到 asyncio/Qt 事件循环的事件交接队列：有界、批量取出、溢出时计数。
+import logging
+import threading
+from collections import deque
+
+DROP_OLDEST = "drop_oldest"  # 队列满时丢弃最旧的事件，保证最新战况优先
+DROP_NEWEST = "drop_newest"  # 队列满时丢弃新到的事件
+
+logger = logging.getLogger(__name__)
+
+
+class EventHandoff:
+    def __init__(self, loop, consumer, capacity=1024, overflow=DROP_OLDEST, batch_size=256):
+        if overflow not in (DROP_OLDEST, DROP_NEWEST):
+            raise ValueError(f"未知的溢出策略: {overflow}")
+        self.loop = loop
+        self.consumer = consumer  # 在事件循环线程中调用，参数为事件列表
+        self.capacity = capacity
+        self.overflow = overflow
+        self.batch_size = batch_size
+        self.queue = deque(maxlen=capacity if overflow == DROP_OLDEST else None)
+        self.lock = threading.Lock()
+        self.scheduled = False
+        self.received = 0
+        self.dropped = 0  # 因队列已满被丢弃的事件数
+        self.coalesced = 0  # 与已排队的唤醒合并、没有单独唤醒事件循环的事件数
+
+    def put(self, event):
+        """生产者线程调用，不阻塞"""
+        self.put_many((event,))
+
+    def put_many(self, events):
+        with self.lock:
+            for event in events:
+                self.received += 1
+                if len(self.queue) >= self.capacity:
+                    self.dropped += 1
+                    if self.overflow == DROP_NEWEST:
+                        continue
+                self.queue.append(event)
+            if self.scheduled:
+                self.coalesced += len(events)
+                return
+            self.scheduled = True
+        self.loop.call_soon_threadsafe(self._drain)
+
+    def _drain(self):
+        with self.lock:
+            count = min(len(self.queue), self.batch_size)
+            batch = [self.queue.popleft() for _ in range(count)]
+            more = bool(self.queue)
+            if not more:
+                self.scheduled = False
+        if more:
+            # 一次只处理一批，剩余的让出给其他回调后继续
+            self.loop.call_soon(self._drain)
+        if batch:
+            try:
+                self.consumer(batch)
+            except Exception as e:
+                logger.error("处理事件批次时出错: %s", e)
+
+    def depth(self):
+        return len(self.queue)
+
+    def stats(self):
+        return {
+            "received": self.received,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "depth": len(self.queue)
+        }
@@ -0,0 +1,49 @@
+#战斗事件记录：解析器一次填充，计算模块和 GUI 直接读取字段。
+from enum import Enum
+
+
+class _StrEnum(str, Enum):
+    # 与普通字符串等价比较和哈希，可以直接作为配置字典的键；打印时输出值本身
+    __str__ = str.__str__
+    __format__ = str.__format__
+
+
+class EventType(_StrEnum):
+    DAMAGE = "damage"  # NPC/玩家对自己
+    PLAYER_ATTACK = "player_attack"  # 自己对目标
+
+
+class HitQuality(_StrEnum):
+    CRITICAL = "强力一击"
+    HIT = "命中"
+    PENETRATES = "穿透"
+    GLANCES = "擦过"
+    LIGHTLY_HITS = "轻轻擦过"
+    MISS = "完全没有打中你"
+    WRECKS = "致命一击"
+
+
+class Event:
+    __slots__ = ("type", "subtype", "timestamp", "amount", "source", "target", "weapon", "weight")
+
+    def __init__(self, type, subtype, timestamp=None, amount=0, source=None, target=None, weapon=None, weight=None):
+        self.type = type
+        self.subtype = subtype
+        self.timestamp = timestamp  # 日志中的游戏时间（UTC 秒），没有时为 None
+        self.amount = amount  # 伤害数值，未命中为 0
+        self.source = source  # 攻击者，自己发出的攻击为 None
+        self.target = target  # 被攻击者，自己受到的攻击为 None
+        self.weapon = weapon
+        self.weight = weight  # 规则产生的事件自带权重，None 表示按 damage_types / reward_types 查表
+
+    def __eq__(self, other):
+        if not isinstance(other, Event):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    __hash__ = None
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)}" for name in self.__slots__
+                           if getattr(self, name) is not None)
+        return f"Event({fields})"
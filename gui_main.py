@@ -1,15 +1,25 @@
 import sys
 import asyncio
-import os
-import json
+import logging
+from collections import deque
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
                              QLineEdit, QPushButton, QComboBox, QListWidget, QListWidgetItem,
-                             QTextEdit, QLabel, QStatusBar, QMessageBox)
+                             QPlainTextEdit, QLabel, QStatusBar, QMessageBox, QCheckBox)
 from PyQt5.QtCore import Qt, QThread, QTimer
 from qasync import QEventLoop, asyncSlot
-from intensity_calculator import IntensityCalculator  # 导入强度计算模块
+from app_logging import setup_logging, shutdown_logging
+from config_manager import CONFIG_FILE, load_config, validate_config, websocket_url
+from config_store import ConfigStore
+from event_queue import EventHandoff
+from events import EventType
+from intensity_calculator import ChannelPipelines  # 导入强度计算模块
+from latency import LatencyTracker
+from metrics import AppMetrics, MetricsServer
+from profiling import RuntimeProfiler
 from EVELogMonitor import EVELogMonitor  # 导入日志监控模块
+from otc_connection import CONNECTED, DISCONNECTED, RECONNECTING
 from otc_controller import OTCController  # 导入 OTC 控制器模块
+from scheduler import DeadlineTicker
 
 class LogMonitorThread(QThread):
     def __init__(self, monitor):
@@ -21,64 +31,99 @@ class LogMonitorThread(QThread):
         if self.monitor_file:
             self.monitor.start(self.monitor_file)
 
+class BufferedLogView(QPlainTextEdit):
+    """只保留最近 max_lines 行的只读日志视图；append 只写入环形缓冲区，由定时器定期批量刷新到界面"""
+
+    def __init__(self, max_lines=1000, flush_interval=200):
+        super().__init__()
+        self.setReadOnly(True)
+        self.setMaximumBlockCount(max_lines)  # 超出的旧行由控件自动删除
+        self.buffer = deque(maxlen=max_lines)  # 两次刷新之间来不及显示的旧行直接丢弃
+        self.flush_timer = QTimer(self)
+        self.flush_timer.timeout.connect(self.flush)
+        self.flush_timer.start(flush_interval)
+
+    def append(self, text):
+        # deque.append 本身是线程安全的，日志后台线程也可以直接调用
+        self.buffer.append(text)
+
+    def flush(self):
+        count = len(self.buffer)
+        if not count:
+            return
+        lines = [self.buffer.popleft() for _ in range(count)]
+        self.appendPlainText("\n".join(lines))  # 一次插入整批，只触发一次重新布局
+
+class LogViewHandler(logging.Handler):
+    """把程序日志显示到日志窗口，由日志后台线程调用，只写入窗口的缓冲区"""
+
+    def __init__(self, view, level=logging.INFO):
+        super().__init__(level)
+        self.view = view
+        self.setFormatter(logging.Formatter("%(asctime)s %(message)s", "%H:%M:%S"))
+
+    def emit(self, record):
+        try:
+            self.view.append(self.format(record))
+        except Exception:
+            self.handleError(record)
+
 class MainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
         self.setWindowTitle("EVE Online OTC 控制器")
         self.setGeometry(100, 100, 800, 900)
 
-        self.config = self.load_config()
-        self.intensity_calculator = IntensityCalculator(self.config)
+        self.config = load_config()  # 与无界面运行共用同一份配置文件
+        # 所有控件的修改都经由 config_store 合并后在后台线程写盘
+        self.config_store = ConfigStore(self.config, CONFIG_FILE)
+        self.intensity_channels = ChannelPipelines(self.config)  # A/B 通道各自计算强度
         self.otc_controller = OTCController(self.config)
-        self.log_monitor = EVELogMonitor(self.config, self.handle_event)
+        self.otc_controller.add_state_listener(self.on_connection_state)
+        # 从读到日志行到指令发出的各阶段延迟，关闭时各调用点只判断一次开关
+        self.latency = LatencyTracker(self.config["latency_tracking"])
+        self.otc_controller.latency = self.latency
+        # 日志线程只把事件放进队列，由 Qt 事件循环线程批量取出处理
+        self.event_handoff = EventHandoff(asyncio.get_event_loop(), self.handle_events,
+                                          self.config["event_queue_size"], self.config["event_queue_overflow"])
+        self.reported_drops = 0
+        self.log_monitor = EVELogMonitor(self.config, self.event_handoff.put,
+                                         batch_callback=self.event_handoff.put_many)
+        self.log_monitor.latency = self.latency
+        self.profiler = RuntimeProfiler(self.config["profile_dir"])
+        self.log_monitor.profiler = self.profiler
+        self.metrics_server = None
         self.log_thread = None
         self.running = False
 
         self.init_ui()
-
-    def load_config(self):
-        CONFIG_FILE = "otc_config.json"
-        default_config = {
-            "ws_ip": "",  # 只存 IP 部分
-            "ws": "",     # 完整的 WebSocket URL
-            "log_dir": "",
-            "listener_id": "",
-            "base_intensity": 0,
-            "app_max_intensity": None,  # 初始为 None，表示未获取
-            "A_max": None,              # 初始为 None
-            "B_max": None,              # 初始为 None
-            "damage_types": {
-                "强力一击": 10, "命中": 8, "穿透": 10, "擦过": 5, "轻轻擦过": 5, "完全没有打中你": 5
-            },
-            "reward_types": {
-                "强力一击": 10, "命中": 8, "穿透": 10, "擦过": 5, "轻轻擦过": 5, "完全没有打中你": 5
-            },
-            "monitored_damage_types": [],
-            "monitored_reward_types": [],
-            "selected_patterns": ["经典"],
-            "waveform_enabled": False,
-            "min_intensity": 0,
-            "max_intensity": 30,  # 仅用于显示默认值
-            "channel": "both",
-            "ticks": 10,
-            "history_ids": []
-        }
+        # 程序日志写入滚动文件和日志窗口，逐事件的调试输出默认关闭
+        setup_logging(self.config["log_level"], self.config["log_file"], self.config["log_max_bytes"],
+                      self.config["log_backup_count"], extra_handlers=(LogViewHandler(self.log_output),))
+        if self.config["metrics_enabled"]:
+            self.start_metrics_server()
+
+    def start_metrics_server(self):
+        metrics = AppMetrics(self.log_monitor, self.otc_controller, self.intensity_channels,
+                             self.event_handoff, self.latency)
+        server = MetricsServer(metrics.collect, self.config["metrics_port"], profiler=self.profiler,
+                               profile_dir=self.config["profile_dir"])
         try:
-            if os.path.exists(CONFIG_FILE):
-                with open(CONFIG_FILE, "r", encoding="utf-8") as f:
-                    loaded_config = json.load(f)
-                    default_config.update(loaded_config)
-        except Exception as e:
-            print(f"加载配置失败: {e}")
-        return default_config
+            server.start()
+            self.metrics_server = server
+        except OSError as e:
+            self.status_bar.showMessage(f"指标接口启动失败: {e}")
 
     def save_config(self):
-        CONFIG_FILE = "otc_config.json"
-        try:
-            with open(CONFIG_FILE, "w", encoding="utf-8") as f:
-                json.dump(self.config, f, ensure_ascii=False, indent=4)
-        except Exception as e:
-            self.status_bar.showMessage(f"保存配置失败: {e}")
+        # 只提交修改，界面线程不做磁盘 I/O，写入失败时由后台线程输出错误
+        self.config_store.save()
+
+    def closeEvent(self, event):
+        self.config_store.close()  # 退出前写入尚未保存的修改
+        if self.metrics_server:
+            self.metrics_server.stop()
+        shutdown_logging()
+        super().closeEvent(event)
 
     def init_ui(self):
         main_widget = QWidget()
@@ -122,17 +167,17 @@ class MainWindow(QMainWindow):
         self.base_intensity_input.textChanged.connect(self.update_base_intensity)
         layout.addWidget(self.base_intensity_input)
 
-        self.app_max_label = QLabel(f"App 强度上限: {self.config['app_max_intensity']}")
+        self.app_max_label = QLabel(f"App 强度上限: A={self.config['A_max']}, B={self.config['B_max']}")
         layout.addWidget(self.app_max_label)
 
-        self.base_intensity_a_label = QLabel(f"A 基础强度: {self.config['base_intensity']}")
+        self.base_intensity_a_label = QLabel(f"A 基础强度: {self.intensity_channels.base_intensity('A')}")
         layout.addWidget(self.base_intensity_a_label)
-        self.base_intensity_b_label = QLabel(f"B 基础强度: {self.config['base_intensity']}")
+        self.base_intensity_b_label = QLabel(f"B 基础强度: {self.intensity_channels.base_intensity('B')}")
         layout.addWidget(self.base_intensity_b_label)
 
-        self.dynamic_intensity_a_label = QLabel(f"A 动态强度: {self.config['base_intensity']}")
+        self.dynamic_intensity_a_label = QLabel(f"A 动态强度: {self.intensity_channels.base_intensity('A')}")
         layout.addWidget(self.dynamic_intensity_a_label)
-        self.dynamic_intensity_b_label = QLabel(f"B 动态强度: {self.config['base_intensity']}")
+        self.dynamic_intensity_b_label = QLabel(f"B 动态强度: {self.intensity_channels.base_intensity('B')}")
         layout.addWidget(self.dynamic_intensity_b_label)
 
         # 攻击类型选择
@@ -197,14 +242,12 @@ class MainWindow(QMainWindow):
 
         # 日志输出
         layout.addWidget(QLabel("日志输出:"))
-        self.log_output = QTextEdit()
-        self.log_output.setReadOnly(True)
+        self.log_output = BufferedLogView(self.config["log_view_lines"], self.config["log_flush_interval"])
         layout.addWidget(self.log_output)
 
         # 波形日志
         layout.addWidget(QLabel("波形发送日志:"))
-        self.waveform_log = QTextEdit()
-        self.waveform_log.setReadOnly(True)
+        self.waveform_log = BufferedLogView(self.config["log_view_lines"], self.config["log_flush_interval"])
         layout.addWidget(self.waveform_log)
 
         # 按钮
@@ -216,6 +259,13 @@ class MainWindow(QMainWindow):
         self.stop_button.clicked.connect(self.stop_program)
         self.stop_button.setEnabled(False)
         buttons_layout.addWidget(self.stop_button)
+        self.latency_checkbox = QCheckBox("延迟统计")
+        self.latency_checkbox.setChecked(self.config["latency_tracking"])
+        self.latency_checkbox.toggled.connect(self.toggle_latency)
+        buttons_layout.addWidget(self.latency_checkbox)
+        self.latency_dump_button = QPushButton("导出延迟统计")
+        self.latency_dump_button.clicked.connect(self.dump_latency)
+        buttons_layout.addWidget(self.latency_dump_button)
         layout.addLayout(buttons_layout)
 
         self.status_bar = QStatusBar()
@@ -281,9 +331,9 @@ class MainWindow(QMainWindow):
             if intensity < 0:
                 raise ValueError("基础强度不能为负数")
             self.config["base_intensity"] = intensity
-            self.intensity_calculator.base_intensity = intensity
-            self.base_intensity_a_label.setText(f"A 基础强度: {intensity}")
-            self.base_intensity_b_label.setText(f"B 基础强度: {intensity}")
+            self.intensity_channels.set_base_intensity(intensity)
+            self.base_intensity_a_label.setText(f"A 基础强度: {self.intensity_channels.base_intensity('A')}")
+            self.base_intensity_b_label.setText(f"B 基础强度: {self.intensity_channels.base_intensity('B')}")
             self.validate_base_intensity()
             self.save_config()
             self.status_bar.showMessage("基础强度已更新并保存")
@@ -306,25 +356,18 @@ class MainWindow(QMainWindow):
         except ValueError:
             self.status_bar.showMessage(f"{key} 奖励强度必须为整数")
 
-    def update_channel(self, channel):
+    @asyncSlot(str)
+    async def update_channel(self, channel):
         self.config["channel"] = channel
-        # 如果已连接，重新获取最大强度
+        # 如果已连接，重新获取最大强度；回复由接收任务分发，不会与波形发送争抢连接
         if self.otc_controller.websocket:
-            asyncio.ensure_future(self.otc_controller.get_max_intensity())
+            await self.otc_controller.get_max_intensity()
         self.update_max_intensity_display()
-        self.intensity_calculator.app_max_intensity = self.config["app_max_intensity"]
         self.save_config()
         self.status_bar.showMessage("通道选择已更新并保存")
 
     def validate_config(self):
-        if not self.config["ws_ip"]:
-            raise ValueError("WebSocket IP 不能为空")
-        if not self.config["log_dir"] or not os.path.exists(self.config["log_dir"]):
-            raise ValueError(f"日志目录无效或不存在: {self.config['log_dir']}")
-        if not self.config["listener_id"]:
-            raise ValueError("游戏ID 不能为空")
-        if self.config["base_intensity"] < 0:
-            raise ValueError("基础强度必须为非负整数")
+        validate_config(self.config)
 
     @asyncSlot()
     async def connect_otc(self):
@@ -332,7 +375,7 @@ class MainWindow(QMainWindow):
             self.waveform_log.append(msg)
         try:
             self.validate_config()
-            self.config["ws"] = f"ws://{self.config['ws_ip']}:60536/1"
+            self.config["ws"] = websocket_url(self.config)
             success = await self.otc_controller.connect(retries=3, delay=2, log_callback=log_to_waveform)
             if success:
                 await self.otc_controller.get_max_intensity()
@@ -351,25 +394,57 @@ class MainWindow(QMainWindow):
     @asyncSlot()
     async def disconnect_otc(self):
         try:
-            if self.otc_controller.websocket:
-                await self.otc_controller.websocket.close()
-                self.otc_controller.websocket = None
+            await self.otc_controller.disconnect()
             self.connect_button.setEnabled(True)
             self.disconnect_button.setEnabled(False)
             self.status_bar.showMessage("OTC 控制器已断开")
-            self.intensity_calculator.reset()
-            self.dynamic_intensity_a_label.setText(f"A 动态强度: {self.config['base_intensity']}")
-            self.dynamic_intensity_b_label.setText(f"B 动态强度: {self.config['base_intensity']}")
+            self.intensity_channels.reset()
+            self.reset_dynamic_labels()
         except Exception as e:
             self.status_bar.showMessage(f"断开 OTC 失败: {e}")
 
-    def handle_event(self, event):
+    def on_connection_state(self, state, detail):
+        # 连接管理在后台自动重连，这里只同步界面状态
+        if state == CONNECTED:
+            self.status_bar.showMessage("OTC 控制器已连接")
+        elif state == RECONNECTING:
+            self.status_bar.showMessage("OTC 连接中断，正在重连...")
+        elif state == DISCONNECTED and detail:
+            self.status_bar.showMessage(f"OTC {detail}")
+
+    def toggle_latency(self, enabled):
+        self.latency.reset()  # 重新开始统计，丢弃关闭期间残留的状态
+        self.latency.enabled = enabled
+        self.config["latency_tracking"] = enabled
+        self.save_config()
+        self.status_bar.showMessage("延迟统计已开启" if enabled else "延迟统计已关闭")
+
+    def dump_latency(self):
         try:
-            self.intensity_calculator.add_event(event)
-            if event["type"] == "player_attack":
-                self.log_output.append(f"检测到玩家攻击: {event['type']} - {event['subtype']}")
+            self.latency.dump(self.config["latency_dump_file"])
+            self.status_bar.showMessage(f"延迟统计已导出到 {self.config['latency_dump_file']}")
+        except Exception as e:
+            self.status_bar.showMessage(f"导出延迟统计失败: {e}")
+
+    def handle_events(self, events):
+        try:
+            self.intensity_channels.add_events(events)
+            if self.latency.enabled:
+                self.latency.applied()
+        except Exception as e:
+            self.log_output.append(f"处理事件出错: {e}")
+        for event in events:
+            self.log_event(event)
+        if self.event_handoff.dropped != self.reported_drops:
+            self.reported_drops = self.event_handoff.dropped
+            self.log_output.append(f"事件队列已满，累计丢弃 {self.reported_drops} 个事件")
+
+    def log_event(self, event):
+        try:
+            if event.type == EventType.PLAYER_ATTACK:
+                self.log_output.append(f"检测到玩家攻击: {event.type} - {event.subtype} {event.amount} -> {event.target}")
             else:
-                self.log_output.append(f"检测到事件: {event['type']} - {event['subtype']}")
+                self.log_output.append(f"检测到事件: {event.type} - {event.subtype} {event.amount} <- {event.source}")
         except Exception as e:
             self.log_output.append(f"处理事件出错: {e}")
 
@@ -378,8 +453,7 @@ class MainWindow(QMainWindow):
         try:
             if not self.running:
                 self.validate_config()
-                ws_url = f"ws://{self.config['ws_ip']}:60536/1"  # 自动补全
-                self.otc_controller.ws_url = ws_url
+                self.config["ws"] = websocket_url(self.config)  # 自动补全
                 self.start_log_monitor()
                 self.running = True
                 self.config["waveform_enabled"] = True
@@ -405,9 +479,8 @@ class MainWindow(QMainWindow):
                 await asyncio.sleep(0.1)
                 self.start_button.setEnabled(True)
                 self.stop_button.setEnabled(False)
-                self.intensity_calculator.reset()
-                self.dynamic_intensity_a_label.setText(f"A 动态强度: {self.config['base_intensity']}")
-                self.dynamic_intensity_b_label.setText(f"B 动态强度: {self.config['base_intensity']}")
+                self.intensity_channels.reset()
+                self.reset_dynamic_labels()
                 self.status_bar.showMessage("程序已关闭")
         except Exception as e:
             self.status_bar.showMessage(f"关闭程序失败: {e}")
@@ -427,32 +500,47 @@ class MainWindow(QMainWindow):
             self.status_bar.showMessage(f"日志监控启动失败: {e}")
 
     async def waveform_loop(self):
-        current_index = 0
+        self.otc_controller.reset_schedule()
+        ticker = DeadlineTicker(self.config["waveform_rate"])
+        next_report = 0
         while self.running and self.config["waveform_enabled"]:
             try:
-                intensity = self.intensity_calculator.update_intensity()
-                app_max = self.config["app_max_intensity"]
-                intensity_percent = min((intensity / app_max) * 100, 100)
-                a_max = self.config.get("A_max") if self.config.get("A_max") is not None else 30
-                b_max = self.config.get("B_max") if self.config.get("B_max") is not None else 30
-
-                if self.config["channel"] == "both":
-                    self.dynamic_intensity_a_label.setText(f"A 动态强度: {min(intensity, a_max)} ({intensity_percent:.1f}%)")
-                    self.dynamic_intensity_b_label.setText(f"B 动态强度: {min(intensity, b_max)} ({intensity_percent:.1f}%)")
-                elif self.config["channel"] == "A":
-                    self.dynamic_intensity_a_label.setText(f"A 动态强度: {min(intensity, a_max)} ({intensity_percent:.1f}%)")
-                    self.dynamic_intensity_b_label.setText(f"B 动态强度: {self.config['base_intensity']}")
-                else:
-                    self.dynamic_intensity_a_label.setText(f"A 动态强度: {self.config['base_intensity']}")
-                    self.dynamic_intensity_b_label.setText(f"B 动态强度: {min(intensity, b_max)} ({intensity_percent:.1f}%)")
-
-                pattern_name = self.config["selected_patterns"][current_index % len(self.config["selected_patterns"])] if self.config["selected_patterns"] else "经典"
-                current_index += 1
-                await self.otc_controller.send_waveform(intensity, self.config["ticks"], pattern_name, self.config["channel"])
-                self.waveform_log.append(f"发送波形: 强度={intensity}, 百分比={intensity_percent:.1f}%, 波形={pattern_name}")
-                await asyncio.sleep(1)
+                await ticker.wait()
+                intensities = self.intensity_channels.update_intensity()
+                for channel, label in (("A", self.dynamic_intensity_a_label), ("B", self.dynamic_intensity_b_label)):
+                    if self.config["channel"] in ("both", channel):
+                        percent = self.otc_controller.channel_percent(intensities[channel], channel)
+                        label.setText(f"{channel} 动态强度: {intensities[channel]:.1f} ({percent}%)")
+                    else:
+                        label.setText(f"{channel} 动态强度: {self.intensity_channels.base_intensity(channel)}")
+
+                # 强度变化时立即发送，不变时只在当前波形播放完之前发送保活
+                # 双通道时 A/B 的强度合并在同一条指令中发送
+                sent = await self.otc_controller.schedule_waveform(
+                    intensities, self.config["ticks"], self.config["selected_patterns"], self.config["channel"],
+                    ticker.period)
+                if sent:
+                    percent, pattern_name = sent
+                    if isinstance(percent, tuple):
+                        self.waveform_log.append(
+                            f"发送波形: A={intensities['A']:.1f} ({percent[0]}%), B={intensities['B']:.1f} ({percent[1]}%), 波形={pattern_name}")
+                    else:
+                        channel = self.config["channel"]
+                        self.waveform_log.append(
+                            f"发送波形: {channel}={intensities[channel]:.1f} ({percent}%), 波形={pattern_name}")
+                if ticker.ticks >= next_report:
+                    next_report = ticker.ticks + int(5 * self.config["waveform_rate"])  # 约每 5 秒刷新一次
+                    if self.latency.enabled:
+                        self.status_bar.showMessage(self.latency.status_text())
+                    else:
+                        stats = ticker.stats()
+                        self.status_bar.showMessage(
+                            f"波形调度 {stats['rate']:.0f}Hz: 抖动 平均 {stats['jitter_mean_ms']:.1f}ms / "
+                            f"最大 {stats['jitter_max_ms']:.1f}ms, 跳过 {stats['missed']} 个周期")
             except Exception as e:
                 self.waveform_log.append(f"波形循环出错: {e}")
+                await asyncio.sleep(1)
+            self.profiler.poll()  # 放在 try 之外，分析工具出错不会耽误指令发送
 
     def validate_base_intensity(self):
         if self.config["base_intensity"] > self.config["app_max_intensity"]:
@@ -469,11 +557,15 @@ class MainWindow(QMainWindow):
         else:
             max_intensity = min(a_max, b_max)
         self.config["app_max_intensity"] = max_intensity
-        self.app_max_label.setText(f"App 强度上限: {self.config['app_max_intensity']}")
-        # 同步到 IntensityCalculator 和 OTCController
-        self.intensity_calculator.app_max_intensity = self.config["app_max_intensity"]
+        self.app_max_label.setText(f"App 强度上限: A={a_max}, B={b_max}")
+        # 每个通道按自己的上限计算强度
+        self.intensity_channels.sync_limits()
         self.otc_controller.config["app_max_intensity"] = self.config["app_max_intensity"]
 
+    def reset_dynamic_labels(self):
+        self.dynamic_intensity_a_label.setText(f"A 动态强度: {self.intensity_channels.base_intensity('A')}")
+        self.dynamic_intensity_b_label.setText(f"B 动态强度: {self.intensity_channels.base_intensity('B')}")
+
 if __name__ == "__main__":
     app = QApplication(sys.argv)
     loop = QEventLoop(app)
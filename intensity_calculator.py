@@ -1,58 +1,320 @@
+import logging
+import math
+import threading
+import time
+from collections import ChainMap, deque
+from events import EventType
+
+logger = logging.getLogger(__name__)
+
+
+class SlidingWindow:
+    """按时间分桶的滑动窗口，维护窗口内的事件数和数值总和，更新和查询都是 O(1)"""
+
+    def __init__(self, seconds=10, bucket_width=1.0):
+        self.bucket_width = bucket_width
+        self.size = max(1, int(round(seconds / bucket_width)))
+        self.seconds = self.size * bucket_width
+        self.counts = [0] * self.size
+        self.sums = [0.0] * self.size
+        self.total_count = 0
+        self.total_sum = 0.0
+        self.current = None  # 当前桶的序号
+
+    def advance(self, now):
+        """清理已经滑出窗口的桶，每个桶最多清理一次"""
+        index = int(now // self.bucket_width)
+        if self.current is None:
+            self.current = index
+            return
+        steps = min(index - self.current, self.size)
+        for i in range(1, steps + 1):
+            slot = (self.current + i) % self.size
+            self.total_count -= self.counts[slot]
+            self.total_sum -= self.sums[slot]
+            self.counts[slot] = 0
+            self.sums[slot] = 0.0
+        if index > self.current:
+            self.current = index
+
+    def add(self, now, value=0, count=1):
+        self.advance(now)
+        slot = self.current % self.size
+        self.counts[slot] += count
+        self.sums[slot] += value
+        self.total_count += count
+        self.total_sum += value
+
+    def rate(self):
+        return self.total_count / self.seconds
+
+    def sum_rate(self):
+        return self.total_sum / self.seconds
+
+    def clear(self):
+        self.counts = [0] * self.size
+        self.sums = [0.0] * self.size
+        self.total_count = 0
+        self.total_sum = 0.0
+        self.current = None
+
+
+# DPS 到 [0, 1] 的映射曲线，full_scale 为达到满强度的 DPS
+DPS_CURVES = {
+    "linear": lambda dps, full_scale: dps / full_scale,
+    "sqrt": lambda dps, full_scale: math.sqrt(dps / full_scale),  # 小伤害也有明显反馈
+    "log": lambda dps, full_scale: math.log1p(dps) / math.log1p(full_scale)  # 大范围 DPS 都能区分
+}
+
+
+def dps_level(dps, full_scale, curve="sqrt"):
+    if dps <= 0 or full_scale <= 0:
+        return 0.0
+    return min(1.0, DPS_CURVES[curve](dps, full_scale))
+
+
 class IntensityCalculator:
-    def __init__(self, config):
+    def __init__(self, config, clock=time.monotonic):
         self.config = config
+        self.clock = clock
+        self.lock = threading.Lock()  # 日志线程和事件循环都可能调用
         self.base_intensity = config.get("base_intensity", 0)
         self.current_intensity = self.base_intensity
-        self.max_intensity_a = config.get("A_max", 30)
-        self.max_intensity_b = config.get("B_max", 30)
         self.app_max_intensity = config.get("app_max_intensity", 30)
-        self.events = []
+        self.events = deque(maxlen=config.get("event_buffer_size", 256))  # 只保留最近的事件
         self.total_increment = 0
         self.total_decrement = 0
-        self.decay_rate = 0.9  # 每次更新时衰减 10%
+        self.decay_rate = 0.9  # "event" 模式：每个事件衰减 10%
+        # "time" 模式：按经过的时间指数衰减，decay_half_life 秒后衰减一半
+        self.decay_mode = config.get("decay_mode", "event")
+        self.half_life = config.get("decay_half_life", 10.0)
+        self.last_decay = self.clock()
+        window = config.get("stats_window", 10)
+        self.event_window = SlidingWindow(window)  # 窗口内的事件数
+        # 受到/造成的伤害，"dps" 强度模式按 dps_window 秒内的 DPS 计算强度
+        dps_window = config.get("dps_window", window)
+        dps_bucket = config.get("dps_bucket_width", 0.5)
+        self.damage_window = SlidingWindow(dps_window, dps_bucket)  # 窗口内受到的伤害
+        self.dealt_window = SlidingWindow(dps_window, dps_bucket)  # 窗口内造成的伤害
+        self.incoming_dps = 0.0
+        self.outgoing_dps = 0.0
+
+    def _decay(self, now):
+        if self.decay_mode != "time":
+            return
+        elapsed = now - self.last_decay
+        self.last_decay = now
+        if elapsed > 0 and self.half_life > 0:
+            factor = 0.5 ** (elapsed / self.half_life)
+            self.total_increment *= factor
+            self.total_decrement *= factor
+
+    def _weights(self, event, now):
+        """返回单个事件的 (增量, 减量)，并记录到滑动窗口"""
+        self.events.append(event)
+        self.event_window.add(now)
+        if event.type == EventType.DAMAGE:
+            self.damage_window.add(now, event.amount)
+            if event.weight is not None:
+                return event.weight, 0
+            if event.subtype in self.config["monitored_damage_types"]:
+                # 限制单次增量不超过 99
+                return min(99, self.config.get("damage_types", {}).get(event.subtype, 0)), 0
+        elif event.type == EventType.PLAYER_ATTACK:
+            self.dealt_window.add(now, event.amount)
+            if event.weight is not None:
+                return 0, event.weight
+            if event.subtype in self.config["monitored_reward_types"]:
+                # 限制单次减量不超过 99
+                return 0, min(99, self.config.get("reward_types", {}).get(event.subtype, 0))
+        return 0, 0
+
+    def _accumulate(self, increment, decrement):
+        # 累加本次事件的增量和减量；"event" 模式下每个事件衰减一次
+        decay = self.decay_rate if self.decay_mode == "event" else 1
+        self.total_increment = min(99, max(0, self.total_increment * decay + increment))
+        self.total_decrement = min(99, max(0, self.total_decrement * decay + decrement))
 
     def add_event(self, event):
         try:
-            if not isinstance(event, dict) or 'type' not in event or 'subtype' not in event:
-                print(f"无效的事件格式: {event}")
-                return
-            self.events.append(event)
-            # 重置单次增量和减量，只基于当前事件计算
-            increment = 0
-            decrement = 0
-            if event["type"] == "damage" and event["subtype"] in self.config["monitored_damage_types"]:
-                increment = self.config.get("damage_types", {}).get(event["subtype"], 0)
-                increment = min(99, increment)  # 限制单次增量不超过 99
-                print(f"强度增加: {event['subtype']} (+{increment})")
-            elif event["type"] == "player_attack" and event["subtype"] in self.config["monitored_reward_types"]:
-                decrement = self.config.get("reward_types", {}).get(event["subtype"], 0)
-                decrement = min(99, decrement)  # 限制单次减量不超过 99
-                print(f"强度减少: {event['subtype']} (-{decrement})")
-
-            # 累加本次事件的增量和减量，并应用衰减
-            self.total_increment = min(99, max(0, self.total_increment * self.decay_rate + increment))
-            self.total_decrement = min(99, max(0, self.total_decrement * self.decay_rate + decrement))
-            self.update_intensity()
+            with self.lock:
+                now = self.clock()
+                self._decay(now)
+                increment, decrement = self._weights(event, now)
+                if increment:
+                    logger.debug("强度增加: %s (+%s)", event.subtype, increment)
+                elif decrement:
+                    logger.debug("强度减少: %s (-%s)", event.subtype, decrement)
+                self._accumulate(increment, decrement)
+                self._update_intensity(now)
         except Exception as e:
-            print(f"处理事件时出错: {e}")
+            logger.error("处理事件时出错: %s", e)
+
+    def _weight_table(self, weights_key, monitored_key):
+        weights = self.config.get(weights_key, {})
+        return {subtype: min(99, weights.get(subtype, 0)) for subtype in self.config[monitored_key]}
 
-    def update_intensity(self):
+    def add_events(self, events):
+        """批量处理一次读取到的事件列表：逐个累加的计算与 add_event 相同，但只加锁、查表和更新强度一次"""
         try:
+            with self.lock:
+                now = self.clock()
+                self._decay(now)
+                damage_weights = self._weight_table("damage_types", "monitored_damage_types")
+                reward_weights = self._weight_table("reward_types", "monitored_reward_types")
+                decay = self.decay_rate if self.decay_mode == "event" else 1
+                total_increment = self.total_increment
+                total_decrement = self.total_decrement
+                damage_count = damage_sum = dealt_count = dealt_sum = 0
+                for event in events:
+                    increment = decrement = 0
+                    if event.type is EventType.DAMAGE:
+                        damage_count += 1
+                        damage_sum += event.amount
+                        increment = damage_weights.get(event.subtype, 0) if event.weight is None else event.weight
+                    elif event.type is EventType.PLAYER_ATTACK:
+                        dealt_count += 1
+                        dealt_sum += event.amount
+                        decrement = reward_weights.get(event.subtype, 0) if event.weight is None else event.weight
+                    total_increment = min(99, max(0, total_increment * decay + increment))
+                    total_decrement = min(99, max(0, total_decrement * decay + decrement))
+                self.total_increment = total_increment
+                self.total_decrement = total_decrement
+                self.events.extend(events)
+                self.event_window.add(now, 0, len(events))
+                if damage_count:
+                    self.damage_window.add(now, damage_sum, damage_count)
+                if dealt_count:
+                    self.dealt_window.add(now, dealt_sum, dealt_count)
+                logger.debug("批量处理 %d 个事件", len(events))
+                self._update_intensity(now)
+        except Exception as e:
+            logger.error("处理事件时出错: %s", e)
+
+    def update_intensity(self, now=None):
+        with self.lock:
+            return self._update_intensity(now)
+
+    def _dps_intensity(self, now):
+        """"dps" 模式：受到的 DPS 按曲线映射到基础强度与上限之间，造成的 DPS 按 dps_outgoing_weight 比例降低强度"""
+        self.damage_window.advance(now)
+        self.dealt_window.advance(now)
+        self.incoming_dps = self.damage_window.sum_rate()
+        self.outgoing_dps = self.dealt_window.sum_rate()
+        curve = self.config.get("dps_curve", "sqrt")
+        incoming = dps_level(self.incoming_dps, self.config.get("dps_full_scale", 300), curve)
+        outgoing = dps_level(self.outgoing_dps, self.config.get("dps_outgoing_full_scale", 1000), curve)
+        span = self.app_max_intensity - self.base_intensity
+        return (self.base_intensity + span * incoming
+                - self.app_max_intensity * self.config.get("dps_outgoing_weight", 0.25) * outgoing)
+
+    def _update_intensity(self, now=None):
+        try:
+            now = self.clock() if now is None else now
+            dps_mode = self.config.get("intensity_mode", "weights") == "dps"
+            if dps_mode:
+                raw_intensity = self._dps_intensity(now)
+            else:
+                # "time" 模式下没有事件时强度也会随时间回落到基础强度
+                self._decay(now)
+                raw_intensity = self.base_intensity + self.total_increment - self.total_decrement
             # 计算当前强度，确保不小于 0
-            raw_intensity = self.base_intensity + self.total_increment - self.total_decrement
             self.current_intensity = max(0, min(raw_intensity, self.app_max_intensity))  # 限制在 [0, app_max_intensity]
-            print(
-                f"计算强度: 基础={self.base_intensity}, 增量={self.total_increment:.1f}, 减量={self.total_decrement:.1f}, 总和={self.current_intensity}")
+            if dps_mode:
+                logger.debug("计算强度: 基础=%s, 受到DPS=%.1f, 造成DPS=%.1f, 总和=%.1f",
+                             self.base_intensity, self.incoming_dps, self.outgoing_dps, self.current_intensity)
+            else:
+                logger.debug("计算强度: 基础=%s, 增量=%.1f, 减量=%.1f, 总和=%s",
+                             self.base_intensity, self.total_increment, self.total_decrement, self.current_intensity)
             return self.current_intensity
         except Exception as e:
-            print(f"更新强度时出错: {e}")
+            logger.error("更新强度时出错: %s", e)
             return self.current_intensity
 
+    def window_stats(self):
+        """最近 stats_window 秒内的事件频率和伤害统计，O(1)，与 intensity_mode 无关"""
+        with self.lock:
+            now = self.clock()
+            for window in (self.event_window, self.damage_window, self.dealt_window):
+                window.advance(now)
+            return {
+                "events_per_second": self.event_window.rate(),
+                "damage_taken": self.damage_window.total_sum,
+                "damage_dealt": self.dealt_window.total_sum,
+                "incoming_dps": self.damage_window.sum_rate(),
+                "outgoing_dps": self.dealt_window.sum_rate()
+            }
+
     def reset(self):
         try:
-            self.current_intensity = self.base_intensity
-            self.total_increment = 0
-            self.total_decrement = 0
-            self.events = []
+            with self.lock:
+                self.current_intensity = self.base_intensity
+                self.total_increment = 0
+                self.total_decrement = 0
+                self.last_decay = self.clock()
+                self.events.clear()
+                for window in (self.event_window, self.damage_window, self.dealt_window):
+                    window.clear()
         except Exception as e:
-            print(f"重置时出错: {e}")
+            logger.error("重置时出错: %s", e)
+
+
+CHANNELS = ("A", "B")
+
+
+class ChannelPipelines:
+    """A/B 通道各自独立计算强度：各自的上限、基础强度、权重和事件路由
+
+    config["channel_settings"][通道] 中的键覆盖全局配置，例如
+    {"A": {"events": ["damage"]}, "B": {"events": ["player_attack"], "base_intensity": 5}}；
+    "events" 为该通道接收的事件类型，不设置时接收全部事件
+    """
+
+    def __init__(self, config, clock=time.monotonic):
+        self.config = config
+        settings = config.setdefault("channel_settings", {})
+        self.calculators = {}
+        for channel in CHANNELS:
+            # ChainMap 随全局配置实时变化，界面上修改权重后无需重建
+            overrides = settings.setdefault(channel, {})
+            self.calculators[channel] = IntensityCalculator(ChainMap(overrides, config), clock)
+        self.sync_limits()
+
+    def overrides(self, channel):
+        return self.config["channel_settings"][channel]
+
+    def sync_limits(self):
+        """每个通道以自己的 App 上限为满量程"""
+        for channel, calculator in self.calculators.items():
+            limit = self.config.get(f"{channel}_max")
+            calculator.app_max_intensity = limit if limit is not None else 30
+
+    def set_base_intensity(self, intensity):
+        """修改全局基础强度，单独设置了基础强度的通道不受影响"""
+        for channel, calculator in self.calculators.items():
+            if "base_intensity" not in self.overrides(channel):
+                calculator.base_intensity = intensity
+
+    def base_intensity(self, channel):
+        return self.calculators[channel].base_intensity
+
+    def _route(self, channel, events):
+        routes = self.overrides(channel).get("events")
+        if routes is None:
+            return events
+        return [event for event in events if event.type in routes]
+
+    def add_events(self, events):
+        for channel, calculator in self.calculators.items():
+            routed = self._route(channel, events)
+            if routed:
+                calculator.add_events(routed)
+
+    def update_intensity(self, now=None):
+        """返回 {"A": 强度, "B": 强度}"""
+        self.sync_limits()
+        return {channel: calculator.update_intensity(now) for channel, calculator in self.calculators.items()}
+
+    def reset(self):
+        for calculator in self.calculators.values():
+            calculator.reset()
@@ -0,0 +1,147 @@
+#端到端延迟统计：从读到日志行开始，记录解析、计入强度、指令入队、指令发出各阶段的累计延迟。
+import json
+import threading
+import time
+from config_store import write_atomic
+
+STAGES = ("parse", "apply", "enqueue", "send")
+STAGE_NAMES = {"parse": "解析", "apply": "计入强度", "enqueue": "入队", "send": "发出"}
+
+
+class LatencyHistogram:
+    """HDR 风格的对数分桶直方图，单位微秒：每个 2 的幂区间分成 sub_buckets 个线性桶，
+    记录是 O(1) 的整数运算，百分位的相对误差不超过 1 / sub_buckets"""
+
+    def __init__(self, sub_bucket_bits=5, max_shift=32):
+        self.sub_bits = sub_bucket_bits + 1
+        self.sub_count = 1 << sub_bucket_bits
+        self.max_shift = max_shift
+        self.counts = [0] * ((max_shift + 2) * self.sub_count)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def _index(self, value):
+        shift = value.bit_length() - self.sub_bits
+        if shift <= 0:
+            return value
+        shift = min(shift, self.max_shift)
+        return (shift + 1) * self.sub_count + (value >> shift) - self.sub_count
+
+    def _lower_bound(self, index):
+        if index < 2 * self.sub_count:
+            return index
+        shift = index // self.sub_count - 1
+        return (index - (shift + 1) * self.sub_count + self.sub_count) << shift
+
+    def record(self, seconds):
+        value = max(0, int(seconds * 1e6))
+        self.counts[min(self._index(value), len(self.counts) - 1)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, p):
+        """返回毫秒"""
+        if not self.count:
+            return 0.0
+        target = max(1, round(self.count * p / 100))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(self._lower_bound(index), self.max) / 1000
+        return self.max / 1000
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count / 1000 if self.count else 0.0,
+            "p50_ms": self.percentile(50),
+            "p95_ms": self.percentile(95),
+            "p99_ms": self.percentile(99),
+            "max_ms": self.max / 1000
+        }
+
+    def clear(self):
+        self.counts = [0] * len(self.counts)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+
+class LatencyTracker:
+    """各阶段都以批次中最早读到的那一行为起点；enabled 为 False 时各个调用点只做一次属性判断
+
+    parsed 在日志线程调用，其余在事件循环线程调用
+    """
+
+    def __init__(self, enabled=False, clock=time.perf_counter):
+        self.enabled = enabled
+        self.clock = clock
+        self.histograms = {stage: LatencyHistogram() for stage in STAGES}
+        self.lock = threading.Lock()
+        self.unapplied = None  # 已解析、尚未计入强度的最早读到时间
+        self.unsent = None  # 已计入强度、尚未生成指令的最早读到时间
+        self.in_flight = {}  # 通道 -> 已入队、尚未发出的指令对应的最早读到时间
+
+    def parsed(self, detected):
+        now = self.clock()
+        self.histograms["parse"].record(now - detected)
+        with self.lock:
+            if self.unapplied is None:
+                self.unapplied = detected
+
+    def applied(self):
+        with self.lock:
+            detected, self.unapplied = self.unapplied, None
+        if detected is None:
+            return
+        self.histograms["apply"].record(self.clock() - detected)
+        if self.unsent is None or detected < self.unsent:
+            self.unsent = detected
+
+    def enqueued(self, channel):
+        detected, self.unsent = self.unsent, None
+        if detected is None:
+            return
+        self.histograms["enqueue"].record(self.clock() - detected)
+        # 双通道指令会替换发送队列中尚未发出的 A/B 指令
+        candidates = [detected]
+        if channel == "both":
+            candidates += [self.in_flight.pop(other) for other in ("A", "B") if other in self.in_flight]
+        if channel in self.in_flight:
+            candidates.append(self.in_flight[channel])
+        self.in_flight[channel] = min(candidates)
+
+    def discard(self):
+        """这段时间的事件没有改变输出内容，不计入入队和发出延迟"""
+        self.unsent = None
+
+    def sent(self, channel):
+        detected = self.in_flight.pop(channel, None)
+        if detected is not None:
+            self.histograms["send"].record(self.clock() - detected)
+
+    def summary(self):
+        return {stage: histogram.summary() for stage, histogram in self.histograms.items()}
+
+    def status_text(self):
+        parts = []
+        for stage in STAGES:
+            s = self.histograms[stage].summary()
+            if s["count"]:
+                parts.append(f"{STAGE_NAMES[stage]} {s['p50_ms']:.1f}/{s['p95_ms']:.1f}/{s['p99_ms']:.1f}")
+        return "延迟 p50/p95/p99 (ms): " + ", ".join(parts) if parts else "延迟统计: 暂无数据"
+
+    def dump(self, path):
+        write_atomic(path, json.dumps({"time": time.time(), "stages": self.summary()}, ensure_ascii=False, indent=4))
+
+    def reset(self):
+        with self.lock:
+            self.unapplied = None
+        self.unsent = None
+        self.in_flight.clear()
+        for histogram in self.histograms.values():
+            histogram.clear()
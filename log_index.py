@@ -0,0 +1,186 @@
+#Gamelogs 目录索引：记录每个日志文件的大小、修改时间和 Listener，增量更新并持久化。
+import json
+import logging
+import os
+import re
+import sys
+import time
+from log_tailer import IN_CLOSE_WRITE, IN_CREATE, IN_DELETE, IN_MODIFY, IN_MOVED_TO, InotifyWatcher
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = "gamelog_index.json"
+HEADER_MAX_BYTES = 1024  # 日志头只有前几行，不读取正文
+LISTENER_RE = re.compile(r"^[ \t]*(?:Listener|收听者)[ \t]*[:：][ \t]*(.+?)[ \t]*\r?$", re.MULTILINE)
+
+
+def read_listener(path):
+    """只读取文件开头固定字节数解析 Listener，读不到返回空字符串"""
+    try:
+        with open(path, "rb") as f:
+            header = f.read(HEADER_MAX_BYTES)
+    except OSError as e:
+        logger.warning("读取日志头失败: %s: %s", path, e)
+        return ""
+    match = LISTENER_RE.search(header.decode("utf-8-sig", "replace"))
+    return match.group(1) if match else ""
+
+
+class GamelogIndex:
+    def __init__(self, log_dir, index_file=INDEX_FILE):
+        self.log_dir = log_dir
+        self.index_file = index_file
+        self.files = {}  # 文件名 -> {"size", "mtime", "listener"}，listener 为 None 表示尚未读取
+        self.dirty = False
+
+    def load(self):
+        try:
+            if os.path.exists(self.index_file):
+                with open(self.index_file, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if data.get("log_dir") == self.log_dir:
+                    self.files = data.get("files", {})
+        except Exception as e:
+            logger.warning("加载日志索引失败: %s", e)
+            self.files = {}
+
+    def save(self):
+        if not self.dirty:
+            return
+        tmp_file = self.index_file + ".tmp"
+        try:
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                json.dump({"log_dir": self.log_dir, "files": self.files}, f, ensure_ascii=False)
+            os.replace(tmp_file, self.index_file)
+            self.dirty = False
+        except Exception as e:
+            logger.error("保存日志索引失败: %s", e)
+
+    def refresh(self):
+        """完整扫描一次目录，只记录大小和修改时间，不读取日志头，返回有变化的文件名"""
+        seen = set()
+        changed = set()
+        try:
+            with os.scandir(self.log_dir) as entries:
+                for entry in entries:
+                    if entry.name.endswith(".txt") and entry.is_file():
+                        seen.add(entry.name)
+                        if self._update(entry.name, entry.stat()):
+                            changed.add(entry.name)
+        except OSError as e:
+            logger.error("扫描日志目录失败: %s", e)
+            return changed
+        for name in set(self.files) - seen:
+            del self.files[name]
+            changed.add(name)
+            self.dirty = True
+        return changed
+
+    def update_file(self, name):
+        """根据目录变化事件更新单个文件"""
+        if not name.endswith(".txt"):
+            return
+        try:
+            st = os.stat(os.path.join(self.log_dir, name))
+        except OSError:
+            if self.files.pop(name, None) is not None:
+                self.dirty = True
+            return
+        self._update(name, st)
+
+    def _update(self, name, st):
+        entry = self.files.get(name)
+        if entry and entry["size"] == st.st_size and entry["mtime"] == st.st_mtime:
+            return False
+        if entry is None:
+            entry = {"listener": None}
+            self.files[name] = entry
+        elif not entry["listener"]:
+            # 之前读取时日志头可能还没写完，文件变化后允许重新读取
+            entry["listener"] = None
+        entry["size"] = st.st_size
+        entry["mtime"] = st.st_mtime
+        self.dirty = True
+        return True
+
+    def listener_of(self, name):
+        """返回文件所属角色，日志头写入后不再变化，因此每个文件只读取一次"""
+        entry = self.files.get(name)
+        if entry is None:
+            return ""
+        if entry["listener"] is None:
+            entry["listener"] = read_listener(os.path.join(self.log_dir, name))
+            self.dirty = True
+        return entry["listener"]
+
+    def latest(self, listener_id=None):
+        """返回最新的日志文件路径，指定 listener_id 时只在该角色的文件中选择"""
+        candidates = sorted(((entry["mtime"], name) for name, entry in self.files.items()), reverse=True)
+        # 从最新的文件开始按需读取日志头，找到第一个匹配的就停止
+        for _, name in candidates:
+            if not listener_id or self.listener_of(name) == listener_id:
+                return os.path.join(self.log_dir, name)
+        return None
+
+
+class InotifyDirectoryWatcher(InotifyWatcher):
+    def __init__(self, log_dir):
+        super().__init__(log_dir, IN_CREATE | IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_DELETE)
+
+    def poll(self, index):
+        """把待处理的目录事件应用到索引，返回有变化的文件名"""
+        changed = {name for _, name in self.read_events()}
+        for name in changed:
+            index.update_file(name)
+        return changed
+
+
+class PollingDirectoryWatcher:
+    """无法使用 inotify 时（Windows/macOS）轮询目录
+
+    新建、删除、重命名文件会更新目录自身的修改时间，平时只 stat 目录一次，变化时才完整扫描；
+    目录修改时间距今不到 racy_window 秒时，同一时间戳内可能还有新文件，下次继续扫描。
+    文件系统不更新目录修改时间时（部分网络共享），靠每 full_interval 秒一次的完整扫描兜底
+    """
+
+    def __init__(self, log_dir, interval=0.5, full_interval=60.0, racy_window=2.0):
+        self.log_dir = log_dir
+        self.interval = interval
+        self.full_interval = full_interval
+        self.racy_window = racy_window
+        now = time.monotonic()
+        self.next_check = now + interval
+        self.next_full_scan = now + full_interval
+        self.dir_mtime = self._dir_mtime()
+        self.racy = True
+
+    def _dir_mtime(self):
+        try:
+            return os.stat(self.log_dir).st_mtime_ns
+        except OSError:
+            return None
+
+    def poll(self, index):
+        now = time.monotonic()
+        if now < self.next_check:
+            return set()
+        self.next_check = now + self.interval
+        mtime = self._dir_mtime()
+        if mtime == self.dir_mtime and not self.racy and now < self.next_full_scan:
+            return set()
+        self.dir_mtime = mtime
+        self.racy = mtime is None or time.time_ns() - mtime < self.racy_window * 1e9
+        self.next_full_scan = now + self.full_interval
+        return index.refresh()
+
+    def close(self):
+        pass
+
+
+def create_directory_watcher(log_dir):
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyDirectoryWatcher(log_dir)
+        except (OSError, AttributeError) as e:
+            logger.info("inotify 不可用，改用定期扫描目录: %s", e)
+    return PollingDirectoryWatcher(log_dir)
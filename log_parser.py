@@ -0,0 +1,257 @@
+#解析 EVE Online 战斗日志行，所有正则在配置变化时一次性编译。
+import calendar
+import logging
+import re
+import time
+from events import Event, EventType, HitQuality
+
+logger = logging.getLogger(__name__)
+
+# 攻击类型及其中英文关键字，顺序即匹配优先级
+ATTACK_PATTERNS = {
+    "强力一击": r"强力一击|Critical Hit",
+    "命中": r"命中|Hit",
+    "穿透": r"穿透|Penetrates",
+    "擦过": r"擦过|Glances",
+    "轻轻擦过": r"轻轻擦过|Lightly Hits",
+    "完全没有打中你": r"完全没有打中你|Misses Completely",
+    "致命一击": r"致命一击|Wrecks"
+}
+
+MISS_SUBTYPE = "完全没有打中你"
+
+# 玩家对目标（奖励）与目标对玩家（伤害）两个方向的前缀，
+# 伤害数值紧跟颜色标签，"对/来自" 与命中类型之间是对方名字和武器。
+# 命中类型总在最后一个 "- " 之后：名字或武器本身可能带 " - " 和命中词（如 "Serpentis - Hit Squad"），
+# 所以这里贪婪匹配到最后一个 "- "，命中类型之后再用 LAST_SEGMENT 确认后面没有其他 "- "
+OUTGOING_PREFIX = r"<color=0xff00ffff>(?:<b>(?P<out_amount>\d+)</b>)?.*?<font size=10>对</font>(?P<out_rest>.*)- "
+INCOMING_PREFIX = r"<color=0xffcc0000>(?:<b>(?P<in_amount>\d+)</b>)?.*?<font size=10>来自</font>(?P<in_rest>.*)- "
+LAST_SEGMENT = r"(?!.*- )"
+
+TAG_RE = re.compile(r"<[^>]*>")
+BOLD_RE = re.compile(r"<b>(.*?)</b>")
+CATEGORY_RE = re.compile(r"\[ [^\]]*\] \((\w+)\)")  # 行首时间戳后的分类，如 (combat) / (notify)
+
+
+def parse_timestamp(line, _cache={}):
+    """解析行首的 "[ 2024.05.01 12:00:00 ]"，返回 UTC 时间戳，没有时返回 None"""
+    if not line.startswith("[ "):
+        return None
+    stamp = line[2:21]
+    ts = _cache.get(stamp)
+    if ts is None:
+        try:
+            ts = calendar.timegm(time.strptime(stamp, "%Y.%m.%d %H:%M:%S"))
+        except ValueError:
+            return None
+        if len(_cache) > 4096:
+            _cache.clear()
+        _cache[stamp] = ts
+    return ts
+
+
+def split_counterpart(rest):
+    """把 "<b>名字</b> - 武器 " 拆成 (名字, 武器)；名字以粗体标签为界，本身带 " - " 时也不会拆错"""
+    bold = BOLD_RE.search(rest)
+    if bold:
+        name = TAG_RE.sub("", bold.group(1)).strip() or None
+        weapon = TAG_RE.sub("", rest[bold.end():]).strip(" -") or None
+        return name, weapon
+    parts = TAG_RE.sub("", rest).split(" - ")
+    name = parts[0].strip() or None
+    weapon = parts[1].strip() if len(parts) > 1 and parts[1].strip() else None
+    return name, weapon
+
+
+def keyword_pattern(keywords):
+    """把 {关键字: 组名} 合并成前缀树形式的正则，每个位置只按首字符分支，规则增多时每行的匹配开销基本不变
+
+    关键字结束处放一个空的命名组，匹配后用 lastgroup 得知命中的关键字；同一前缀优先匹配更长的关键字
+    """
+    trie = {}
+    for keyword, group in keywords.items():
+        node = trie
+        for char in keyword.lower():
+            node = node.setdefault(char, {})
+        node.setdefault("", group)
+    return re.compile(_trie_regex(trie), re.IGNORECASE)
+
+
+def _trie_regex(node):
+    branches = [re.escape(char) + _trie_regex(child) for char, child in node.items() if char]
+    if "" in node:
+        branches.append(f"(?P<{node['']}>)")
+    if len(branches) == 1:
+        return branches[0]
+    return f"(?:{'|'.join(branches)})"
+
+
+class RuleMatcher:
+    """config["rules"] 中的声明式规则：匹配条件 -> 事件类型 -> 权重，加载时按日志分类编译为单个关键字正则
+
+    规则格式: {"name": "跃迁扰断", "category": "combat", "keywords": ["跃迁扰断", "Warp scramble attempt"],
+               "type": "damage", "weight": 20}
+    category 为日志分类（不含括号），不设置时匹配所有分类；type 为 "damage"（增加强度）或 "player_attack"（降低强度）
+    格式错误的规则（未知 type、缺少或为空的关键字、非数字权重）记录警告后跳过，不影响其他规则
+    """
+
+    def __init__(self, rules):
+        self._groups = {}  # 组名 -> (事件类型, 规则名, 权重)
+        by_category = {}
+        any_category = {}
+        for index, rule in enumerate(rules):
+            try:
+                category, info, rule_keywords = self.validate(rule)
+            except ValueError as e:
+                logger.warning("忽略第 %d 条规则 %s: %s", index + 1, rule, e)
+                continue
+            keywords = by_category.setdefault(category.lower(), {}) if category else any_category
+            for keyword in rule_keywords:
+                group = f"k{len(self._groups)}"
+                self._groups[group] = info
+                keywords.setdefault(keyword.lower(), group)
+        self._patterns = {}
+        for category, keywords in by_category.items():
+            # 指定分类的规则优先于不限分类的规则
+            for keyword, group in any_category.items():
+                keywords.setdefault(keyword, group)
+            self._patterns[category] = keyword_pattern(keywords)
+        self._default = keyword_pattern(any_category) if any_category else None
+
+    @staticmethod
+    def validate(rule):
+        """检查一条规则，返回 (分类, (事件类型, 规则名, 权重), 关键字列表)，格式错误时抛出 ValueError"""
+        if not isinstance(rule, dict):
+            raise ValueError("规则必须是对象")
+        keywords = rule.get("keywords")
+        if isinstance(keywords, str):
+            keywords = [keywords]
+        if not isinstance(keywords, list) or not keywords:
+            raise ValueError("缺少 keywords")
+        if not all(isinstance(keyword, str) and keyword.strip() for keyword in keywords):
+            # 空关键字会匹配所有日志行
+            raise ValueError("keywords 中有空关键字或非字符串")
+        try:
+            event_type = EventType(rule.get("type", EventType.DAMAGE))
+        except ValueError:
+            raise ValueError(f"未知的 type: {rule.get('type')!r}，可选 {[t.value for t in EventType]}")
+        weight = rule.get("weight", 0)
+        if isinstance(weight, bool) or not isinstance(weight, (int, float)):
+            raise ValueError(f"weight 必须是数字: {weight!r}")
+        category = rule.get("category")
+        if category is not None and not isinstance(category, str):
+            raise ValueError(f"category 必须是字符串: {category!r}")
+        name = rule.get("name") or keywords[0]
+        return category, (event_type, str(name), max(0, min(99, weight))), keywords
+
+    def match(self, line):
+        """返回 (事件类型, 规则名, 权重)，没有匹配的规则返回 None"""
+        header = CATEGORY_RE.match(line)
+        if header:
+            pattern = self._patterns.get(header.group(1).lower(), self._default)
+            start = header.end()
+        else:
+            pattern, start = self._default, 0
+        if pattern is None:
+            return None
+        match = pattern.search(line, start)
+        return self._groups[match.lastgroup] if match else None
+
+
+class CombatLineParser:
+    def __init__(self, config):
+        self.config = config
+        self._damage_types = None
+        self._reward_types = None
+        self._pattern = None
+        self._groups = {}
+        self._miss_damage = False
+        self._miss_reward = False
+        self._rules = None  # 最近一次编译成功的 config["rules"] 列表
+        self._rejected_rules = None  # 编译失败的列表，整体替换之前不再重试
+        self._rule_matcher = None
+        self.unmatched = 0  # 没有匹配任何命中类型或规则的战斗日志行数
+        self.rebuild()
+
+    def rebuild(self):
+        """根据当前监控的类型重新编译组合正则"""
+        self._damage_types = list(self.config["monitored_damage_types"])
+        self._reward_types = list(self.config["monitored_reward_types"])
+        self._groups = {}
+        branches = []
+        for direction, event_type, prefix, monitored in (
+                ("out", EventType.PLAYER_ATTACK, OUTGOING_PREFIX, self._reward_types),
+                ("in", EventType.DAMAGE, INCOMING_PREFIX, self._damage_types)):
+            alternatives = []
+            for index, (attack_type, pattern) in enumerate(ATTACK_PATTERNS.items()):
+                if attack_type not in monitored:
+                    continue
+                # 组名同时编码方向与命中类型，例如 out0 / in3
+                group = f"{direction}{index}"
+                self._groups[group] = (direction, event_type, HitQuality(attack_type))
+                alternatives.append(f"(?P<{group}>{pattern})")
+            if alternatives:
+                branches.append(f"(?:{prefix}(?:{'|'.join(alternatives)}){LAST_SEGMENT})")
+        self._pattern = re.compile("|".join(branches), re.IGNORECASE) if branches else None
+        self._miss_damage = MISS_SUBTYPE in self._damage_types
+        self._miss_reward = MISS_SUBTYPE in self._reward_types
+        rules = self.config.get("rules")
+        try:
+            matcher = RuleMatcher(rules) if rules else None
+        except Exception as e:
+            # 不保留旧规则，避免界面上看到的配置和实际生效的规则不一致
+            logger.error("编译规则失败，所有规则暂不生效: %s", e)
+            self._rule_matcher = None
+            self._rejected_rules = rules
+            return
+        self._rule_matcher = matcher
+        self._rules = rules
+        self._rejected_rules = None
+
+    def _check_config(self):
+        # 规则列表只比较对象本身，修改规则后需要整体替换 config["rules"]，避免每行比较所有规则
+        rules = self.config.get("rules")
+        if (self.config["monitored_damage_types"] != self._damage_types
+                or self.config["monitored_reward_types"] != self._reward_types
+                or (rules is not self._rules and rules is not self._rejected_rules)):
+            self.rebuild()
+
+    def parse(self, line):
+        combat = "(combat)" in line or "(combat)" in line.lower()
+        if not combat and not self.config.get("rules"):
+            return None
+        self._check_config()
+        if combat:
+            event = self._parse_combat(line.strip())
+            if event:
+                return event
+        if self._rule_matcher is not None:
+            matched = self._rule_matcher.match(line)
+            if matched:
+                event_type, name, weight = matched
+                return Event(event_type, name, parse_timestamp(line), weight=weight)
+        if combat:
+            self.unmatched += 1
+        return None
+
+    def _parse_combat(self, line):
+        if self._pattern is not None:
+            match = self._pattern.search(line)
+            if match:
+                direction, event_type, subtype = self._groups[match.lastgroup]
+                amount = match.group(f"{direction}_amount")
+                name, weapon = split_counterpart(match.group(f"{direction}_rest"))
+                if direction == "out":
+                    source, target = None, name
+                else:
+                    source, target = name, None
+                return Event(event_type, subtype, parse_timestamp(line),
+                             int(amount) if amount else 0, source, target, weapon)
+
+        if self._miss_damage and MISS_SUBTYPE in line:
+            return Event(EventType.DAMAGE, HitQuality.MISS, parse_timestamp(line))
+
+        if self._miss_reward and "你的" in line and "完全没有打中" in line:
+            return Event(EventType.PLAYER_ATTACK, HitQuality.MISS, parse_timestamp(line))
+
+        return None
@@ -0,0 +1,163 @@
+#日志文件增量读取与变化通知：Linux 下使用 inotify，其他平台退回自适应轮询。
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import sys
+import time
+
+logger = logging.getLogger(__name__)
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVE_SELF = 0x00000800
+IN_DELETE_SELF = 0x00000400
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+
+_EVENT_HEADER = struct.Struct("iIII")  # struct inotify_event: wd, mask, cookie, len
+
+
+class InotifyWatcher:
+    """通过 inotify 等待文件写入，空闲时不消耗 CPU"""
+
+    def __init__(self, path, mask=IN_MODIFY | IN_CLOSE_WRITE | IN_MOVE_SELF | IN_DELETE_SELF):
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 失败")
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"inotify_add_watch 失败: {path}")
+
+    def fileno(self):
+        return self.fd
+
+    def wait(self, timeout):
+        """等待文件变化，超时返回 False"""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return False
+        self.drain()
+        return True
+
+    def drain(self):
+        try:
+            while os.read(self.fd, 4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def read_events(self):
+        """非阻塞地读取所有待处理事件，返回 [(mask, 文件名)]"""
+        events = []
+        try:
+            while True:
+                buf = os.read(self.fd, 65536)
+                if not buf:
+                    break
+                offset = 0
+                while offset < len(buf):
+                    _, mask, _, length = _EVENT_HEADER.unpack_from(buf, offset)
+                    offset += _EVENT_HEADER.size
+                    name = buf[offset:offset + length].rstrip(b"\0")
+                    offset += length
+                    events.append((mask, os.fsdecode(name)))
+        except BlockingIOError:
+            pass
+        return events
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class PollingWatcher:
+    """基于 stat 的轮询，文件活跃时快速轮询，空闲时逐步退避
+
+    Windows/macOS 上这是主要路径，退避上限保持在 50ms 以内，空闲后的第一条日志最多晚 50ms；
+    每次轮询只是一次 stat，20 次/秒的开销可以忽略
+    """
+
+    def __init__(self, path, min_interval=0.005, max_interval=0.05, backoff=1.5):
+        self.path = path
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.interval = min_interval
+        self.last_stat = self._stat()
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+            return st.st_size, st.st_mtime_ns
+        except OSError:
+            return None
+
+    def wait(self, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            current = self._stat()
+            if current != self.last_stat:
+                self.last_stat = current
+                self.interval = self.min_interval
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(self.interval, remaining))
+            self.interval = min(self.interval * self.backoff, self.max_interval)
+
+    def close(self):
+        pass
+
+
+class LineReader:
+    """按字节增量读取日志，只输出以换行结尾的完整行，未写完的行留到下次读取"""
+
+    def __init__(self, f, encoding="utf-8", chunk_size=65536):
+        self.f = f  # 以 "rb", buffering=0 打开的文件
+        self.encoding = encoding
+        self.chunk = bytearray(chunk_size)  # 复用的读缓冲区
+        self.view = memoryview(self.chunk)
+        self.pending = bytearray()  # 上次读取剩下的不完整行
+        self.offset = f.tell()  # 已消费的字节偏移（总是落在行边界上）
+
+    def read_lines(self):
+        lines = []
+        while True:
+            n = self.f.readinto(self.chunk)
+            if not n:
+                break
+            end = self.chunk.rfind(b"\n", 0, n) + 1
+            if end:
+                if self.pending:
+                    self.pending += self.view[:end]
+                    text = self.pending.decode(self.encoding, "replace")
+                    self.offset += len(self.pending)
+                    self.pending.clear()
+                else:
+                    text = str(self.view[:end], self.encoding, "replace")
+                    self.offset += end
+                lines.extend(text.split("\n")[:-1])
+            if end < n:
+                self.pending += self.view[end:n]
+            if n < len(self.chunk):
+                break
+        return lines
+
+
+def create_watcher(path):
+    """优先使用 inotify，不可用时退回轮询"""
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(path)
+        except (OSError, AttributeError) as e:
+            logger.info("inotify 不可用，改用轮询: %s", e)
+    return PollingWatcher(path)
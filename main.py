@@ -1,84 +1,214 @@
+#无界面运行：不加载 PyQt5 / qasync，与界面共用 otc_config.json，适合在游戏电脑旁的低功耗设备上长期运行。
+#用法: python main.py [-c otc_config.json] [--ws-ip IP] [--log-dir 目录] [--listener-id 角色] [--check]
+import argparse
 import asyncio
 import signal
 import sys
-from config import config, validate_config
-from EVELogMonitor import EVELogMonitor
-from intensity_calculator import IntensityCalculator
-from otc_controller import OTCController
+from config_manager import CONFIG_FILE, load_config, validate_config, websocket_url
+
+LOG_RETRY_INTERVAL = 2  # 秒，游戏尚未生成日志文件时的重试间隔
 
 class MainApp:
-    def __init__(self):
-        """初始化程序，加载配置和组件"""
+    def __init__(self, config):
+        """初始化组件；配置已由 main() 读取并校验"""
+        # 在这里才导入各组件，--help 和配置错误时不必加载 asyncio 以外的依赖
+        from app_logging import setup_logging
+        from EVELogMonitor import EVELogMonitor
+        from intensity_calculator import ChannelPipelines
+        from latency import LatencyTracker
+        from otc_controller import OTCController
         self.config = config
-        try:
-            validate_config(self.config)
-        except ValueError as e:
-            print(f"配置错误: {e}")
-            sys.exit(1)
-        self.intensity_calculator = IntensityCalculator(self.config)
+        setup_logging(self.config["log_level"], self.config["log_file"], self.config["log_max_bytes"],
+                      self.config["log_backup_count"])
+        self.intensity_channels = ChannelPipelines(self.config)  # A/B 通道各自计算强度
         self.otc_controller = OTCController(self.config)
-        self.log_monitor = EVELogMonitor(self.config, self.handle_event)
+        self.log_monitor = EVELogMonitor(self.config, None)  # 回调在 start() 中连接到事件队列
+        self.latency = LatencyTracker(self.config["latency_tracking"])
+        self.otc_controller.latency = self.latency
+        self.log_monitor.latency = self.latency
+        self.profiler = None  # 只在开启指标接口时创建，http.server 和 cProfile 不随启动加载
+        self.metrics = None
+        self.metrics_server = None
+        self.event_handoff = None
+        self.ticker = None
         self.running = True  # 控制程序运行状态
 
     async def start(self):
-        """启动程序"""
+        """启动程序，返回进程退出码"""
+        from event_queue import EventHandoff
         try:
             print("程序启动中...")
-            await self.otc_controller.connect()
-            self.log_monitor.start()
+            # 日志线程只把事件放进队列，由事件循环批量取出处理
+            self.event_handoff = EventHandoff(asyncio.get_running_loop(), self.handle_events,
+                                              self.config["event_queue_size"], self.config["event_queue_overflow"])
+            self.log_monitor.callback = self.event_handoff.put
+            self.log_monitor.batch_callback = self.event_handoff.put_many
+            if self.config["metrics_enabled"]:
+                self.start_metrics_server()
+            log_file = await self.wait_for_log_file()
+            if not log_file:
+                return 0
+            # 先开始读取日志再连接，握手期间的事件照常计入强度，连接后的第一条指令就会包含
+            self.log_monitor.start(log_file)
+            if not await self.otc_controller.connect():
+                return 1
+            await self.otc_controller.get_max_intensity()
             await self.waveform_loop()
+            return 0
         except Exception as e:
             print(f"程序运行出错: {e}")
+            return 1
         finally:
             await self.cleanup()
 
-    def handle_event(self, event):
-        """处理日志事件"""
+    def start_metrics_server(self):
+        from metrics import AppMetrics, MetricsServer
+        from profiling import RuntimeProfiler
+        self.profiler = RuntimeProfiler(self.config["profile_dir"])
+        self.log_monitor.profiler = self.profiler
+        self.metrics = AppMetrics(self.log_monitor, self.otc_controller, self.intensity_channels,
+                                  self.event_handoff, self.latency)
+        server = MetricsServer(self.metrics.collect, self.config["metrics_port"], profiler=self.profiler,
+                               profile_dir=self.config["profile_dir"])
         try:
-            self.intensity_calculator.add_event(event)
+            server.start()
+            self.metrics_server = server
+        except OSError as e:
+            print(f"指标接口启动失败: {e}")
+
+    async def wait_for_log_file(self):
+        """游戏还没有生成当前角色的日志时定期重新查找，直到找到或程序停止"""
+        while self.running:
+            log_file = self.log_monitor.find_latest_log_file()
+            if log_file:
+                return log_file
+            print(f"未找到匹配的日志文件，{LOG_RETRY_INTERVAL} 秒后重试")
+            await asyncio.sleep(LOG_RETRY_INTERVAL)
+        return None
+
+    def handle_events(self, events):
+        """在事件循环线程中批量处理日志事件"""
+        try:
+            self.intensity_channels.add_events(events)
+            if self.latency.enabled:
+                self.latency.applied()
         except Exception as e:
             print(f"处理事件出错: {e}")
 
     async def waveform_loop(self):
         """波形输出循环"""
-        current_index = 0
+        from scheduler import DeadlineTicker
+        self.otc_controller.reset_schedule()
+        self.ticker = DeadlineTicker(self.config["waveform_rate"])
         while self.running:
             try:
-                if self.config["waveform_enabled"]:
-                    intensity = self.intensity_calculator.update_intensity()
-                    if self.config["selected_patterns"]:
-                        pattern_name = self.config["selected_patterns"][current_index % len(self.config["selected_patterns"])]
-                        current_index += 1
-                    else:
-                        pattern_name = "经典"  # 默认波形
-                        print("警告: 未选择波形模式，使用默认 '经典' 模式")
-                    await self.otc_controller.send_waveform(intensity, self.config["ticks"], pattern_name, self.config["channel"])
-                else:
-                    print("波形输出已暂停")
-                    await asyncio.sleep(1)  # 可根据需求调整休眠时间
+                await self.ticker.wait()
+                intensities = self.intensity_channels.update_intensity()
+                # 强度变化时立即发送，不变时只在当前波形播放完之前发送保活；双通道合并为一条指令
+                sent = await self.otc_controller.schedule_waveform(
+                    intensities, self.config["ticks"], self.config["selected_patterns"], self.config["channel"],
+                    self.ticker.period)
+                if sent and not self.config["selected_patterns"]:
+                    print("警告: 未选择波形模式，使用默认 '经典' 模式")
             except Exception as e:
                 print(f"波形循环出错: {e}")
                 await asyncio.sleep(1)  # 出错时休眠，避免高频错误
+            if self.profiler is not None:
+                self.profiler.poll()  # 放在 try 之外，分析工具出错不会耽误指令发送
 
     async def cleanup(self):
         """清理资源"""
+        from app_logging import shutdown_logging
         try:
             self.log_monitor.stop()
+            if self.metrics_server:
+                self.metrics_server.stop()
+            if self.ticker:
+                print(f"波形调度统计: {self.ticker.stats()}")
+            if self.latency.enabled:
+                print(self.latency.status_text())
+                self.latency.dump(self.config["latency_dump_file"])
             await self.otc_controller.disconnect()
             print("资源已清理，程序退出")
         except Exception as e:
             print(f"清理资源出错: {e}")
+        finally:
+            shutdown_logging()
 
     def stop(self):
         """停止程序"""
         self.running = False
 
-# 捕获 Ctrl+C 信号以优雅退出
-def signal_handler(signum, frame):
-    print("收到终止信号，准备退出...")
-    app.stop()
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="EVE Online OTC 控制器（无界面）")
+    parser.add_argument("-c", "--config", default=CONFIG_FILE, help=f"配置文件，默认与界面共用 {CONFIG_FILE}")
+    parser.add_argument("--ws-ip", help="OTC 控制器 IP，自动补全端口和路径")
+    parser.add_argument("--ws", help="完整的 WebSocket 地址，优先于 --ws-ip 和配置文件")
+    parser.add_argument("--log-dir", help="游戏日志目录")
+    parser.add_argument("--listener-id", help="监听的角色名")
+    parser.add_argument("--channel", choices=["A", "B", "both"], help="输出通道")
+    parser.add_argument("--log-level", choices=["DEBUG", "INFO", "WARNING", "ERROR"], help="程序日志级别")
+    parser.add_argument("--metrics-port", type=int, help="在 127.0.0.1 的该端口上开启 /metrics 和性能分析接口")
+    parser.add_argument("--latency", action="store_true", help="记录端到端延迟，退出时写入 latency_dump_file")
+    parser.add_argument("--check", action="store_true", help="只校验配置并显示将要监控的日志文件，然后退出")
+    return parser.parse_args(argv)
+
+def apply_args(config, args):
+    """命令行参数只覆盖本次运行，不写回配置文件"""
+    for key in ("ws_ip", "log_dir", "listener_id", "channel", "log_level"):
+        value = getattr(args, key)
+        if value is not None:
+            config[key] = value
+    if args.ws:
+        config["ws_ip"] = ""
+        config["ws"] = args.ws
+    if args.metrics_port is not None:
+        config["metrics_enabled"] = True
+        config["metrics_port"] = args.metrics_port
+    if args.latency:
+        config["latency_tracking"] = True
+
+def main(argv=None):
+    args = parse_args(argv)
+    config = load_config(args.config)
+    apply_args(config, args)
+    try:
+        validate_config(config)
+    except ValueError as e:
+        print(f"配置错误: {e}")
+        return 1
+    config["ws"] = websocket_url(config)
+    if args.check:
+        from EVELogMonitor import EVELogMonitor
+        log_file = EVELogMonitor(config, None).find_latest_log_file()
+        print(f"WebSocket: {config['ws']}")
+        print(f"日志文件: {log_file or '未找到'}")
+        return 0 if log_file else 1
+    app = MainApp(config)
+    return asyncio.run(run(app))
+
+async def run(app):
+    """收到 Ctrl+C 或终止信号时取消主任务，正在等待连接或发送时也能立即退出并清理资源"""
+    loop = asyncio.get_running_loop()
+    task = asyncio.current_task()
+
+    def request_stop():
+        if not app.running:
+            return  # 已在退出中，不打断清理
+        print("收到终止信号，准备退出...")
+        app.stop()
+        task.cancel()
+
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, request_stop)
+        except (NotImplementedError, RuntimeError):
+            # Windows 的事件循环不支持 add_signal_handler
+            signal.signal(signum, lambda signum, frame: loop.call_soon_threadsafe(request_stop))
+    try:
+        return await app.start()
+    except asyncio.CancelledError:
+        return 0
 
 if __name__ == "__main__":
-    signal.signal(signal.SIGINT, signal_handler)
-    app = MainApp()
-    asyncio.run(app.start())
+    sys.exit(main())
@@ -0,0 +1,203 @@
+#本地 HTTP 指标接口：GET /metrics 输出 Prometheus 文本格式，另提供运行中开关性能分析的 POST 接口。
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+import profiling
+from latency import STAGES
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "eve_otc_"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def format_metrics(families):
+    """families 为 (名称, 类型, 说明, 样本) 列表，样本是数值或 [(标签字典, 数值)]"""
+    lines = []
+    for name, metric_type, help_text, samples in families:
+        name = PREFIX + name
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        if not isinstance(samples, list):
+            samples = [({}, samples)]
+        for labels, value in samples:
+            label_text = ",".join(f'{key}="{_escape(val)}"' for key, val in labels.items())
+            lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+class AppMetrics:
+    """抓取时直接读取各组件已有的计数器，热路径上不做任何额外记录"""
+
+    def __init__(self, monitor, controller, channels, handoff=None, latency=None):
+        self.monitor = monitor
+        self.controller = controller
+        self.channels = channels
+        self.handoff = handoff  # 在事件循环启动后创建，之后再赋值
+        self.latency = latency
+        self.last_sample = (time.monotonic(), 0)  # 上次抓取的时间和行数，用于计算行/秒
+
+    def collect(self):
+        monitor = self.monitor
+        now = time.monotonic()
+        lines_read = monitor.lines_read
+        last_time, last_lines = self.last_sample
+        self.last_sample = (now, lines_read)
+        lines_per_second = (lines_read - last_lines) / (now - last_time) if now > last_time else 0.0
+
+        families = [
+            ("lines_read_total", "counter", "读取的日志行数", lines_read),
+            ("lines_per_second", "gauge", "距上次抓取的平均读取速度（行/秒）", round(lines_per_second, 3)),
+            ("events_total", "counter", "解析到的事件数",
+             [({"type": event_type, "subtype": subtype}, count)
+              for (event_type, subtype), count in list(monitor.event_counts.items())]),
+            ("unparsed_combat_lines_total", "counter", "没有匹配任何命中类型或规则的战斗日志行",
+             monitor.parser.unmatched),
+            ("read_errors_total", "counter", "读取或解析日志时出错的次数", monitor.read_errors),
+            ("intensity", "gauge", "当前强度",
+             [({"channel": channel}, calculator.current_intensity)
+              for channel, calculator in self.channels.calculators.items()]),
+        ]
+        stats = {channel: calculator.window_stats() for channel, calculator in self.channels.calculators.items()}
+        families += [
+            ("window_events_per_second", "gauge", "最近 stats_window 秒内每秒计入强度的事件数",
+             [({"channel": channel}, round(s["events_per_second"], 3)) for channel, s in stats.items()]),
+            ("window_damage", "gauge", "最近 dps_window 秒内的伤害总和",
+             [({"channel": channel, "direction": direction}, s[key])
+              for channel, s in stats.items() for direction, key in (("taken", "damage_taken"), ("dealt", "damage_dealt"))]),
+            ("window_dps", "gauge", "最近 dps_window 秒内的平均 DPS",
+             [({"channel": channel, "direction": direction}, round(s[key], 3))
+              for channel, s in stats.items() for direction, key in (("in", "incoming_dps"), ("out", "outgoing_dps"))]),
+        ]
+        controller = self.controller
+        connection = controller.connection
+        families += [
+            ("frames_scheduled_total", "counter", "调度发送的波形指令数", controller.sent_count),
+            ("frames_rate_limited_total", "counter", "因超过最大发送速率推迟的指令数", controller.skipped_count),
+            ("frames_sent_total", "counter", "实际写入连接的指令数", connection.frames_sent if connection else 0),
+            ("reconnects_total", "counter", "断线后重新连接的次数", connection.reconnects if connection else 0),
+            ("connected", "gauge", "是否已连接 OTC", 1 if controller.websocket else 0),
+        ]
+        if self.handoff is not None:
+            families += [
+                ("queue_depth", "gauge", "事件队列中等待处理的事件数", self.handoff.depth()),
+                ("queue_dropped_total", "counter", "事件队列已满时丢弃的事件数", self.handoff.dropped),
+            ]
+        if self.latency is not None and self.latency.enabled:
+            samples = []
+            for stage in STAGES:
+                summary = self.latency.histograms[stage].summary()
+                for quantile in ("50", "95", "99"):
+                    samples.append(({"stage": stage, "quantile": f"0.{quantile}"}, summary[f"p{quantile}_ms"] / 1000))
+            families.append(("latency_seconds", "gauge", "从读到日志行开始各阶段的累计延迟", samples))
+        return families
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server.owner
+        path = urlparse(self.path).path.rstrip("/")
+        try:
+            if path == "/metrics":
+                body = format_metrics(server.collect())
+                self._reply(200, body, "text/plain; version=0.0.4; charset=utf-8")
+            elif path in server.actions:
+                # 会改变运行状态的接口只接受 POST，浏览器预取或网页里的链接不会误触发
+                self._reply(405, f"{path} 需要使用 POST\n", allow="POST")
+            else:
+                self._not_found(server)
+        except Exception as e:
+            logger.error("处理 %s 时出错: %s", path, e)
+            self._reply(500, f"出错: {e}\n")
+
+    def do_POST(self):
+        server = self.server.owner
+        path = urlparse(self.path).path.rstrip("/")
+        try:
+            action = server.actions.get(path)
+            if action is not None:
+                self._reply(200, action() + "\n")
+            elif path == "/metrics":
+                self._reply(405, "/metrics 需要使用 GET\n", allow="GET")
+            else:
+                self._not_found(server)
+        except Exception as e:
+            logger.error("处理 %s 时出错: %s", path, e)
+            self._reply(500, f"出错: {e}\n")
+
+    def _not_found(self, server):
+        self._reply(404, "未知路径，可用: GET /metrics，POST " + " ".join(sorted(server.actions)) + "\n")
+
+    def _reply(self, status, body, content_type="text/plain; charset=utf-8", allow=None):
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        if allow:
+            self.send_header("Allow", allow)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logger.debug("metrics: " + format, *args)
+
+
+class MetricsServer:
+    """只监听本机地址；请求在独立线程中处理，不占用界面和事件循环线程"""
+
+    def __init__(self, collect, port=9464, host="127.0.0.1", profiler=None, profile_dir="profiles"):
+        self.collect = collect
+        self.host = host
+        self.port = port
+        self.profiler = profiler or profiling.RuntimeProfiler(profile_dir)
+        self.profile_dir = profile_dir
+        self.httpd = None
+        self.thread = None
+        self.actions = {
+            "/profile/start": self._profile_start,
+            "/profile/stop": self._profile_stop,
+            "/profile/status": lambda: str(self.profiler.status()),
+            "/tracemalloc/start": self._tracemalloc_start,
+            "/tracemalloc/snapshot": self._tracemalloc_snapshot,
+            "/tracemalloc/stop": self._tracemalloc_stop,
+        }
+
+    def start(self):
+        self.httpd = ThreadingHTTPServer((self.host, self.port), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.owner = self
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="metrics", daemon=True)
+        self.thread.start()
+        logger.info("指标接口已启动: http://%s:%d/metrics", self.host, self.httpd.server_address[1])
+
+    def stop(self):
+        if self.httpd:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+
+    def _profile_start(self):
+        self.profiler.start()
+        return "cProfile 已开启，日志线程和事件循环线程会在下一次循环时开始记录"
+
+    def _profile_stop(self):
+        self.profiler.stop()
+        return f"cProfile 已停止，各线程的结果将写入 {self.profiler.output_dir}/"
+
+    def _tracemalloc_start(self):
+        profiling.start_tracemalloc()
+        return "tracemalloc 已开启"
+
+    def _tracemalloc_snapshot(self):
+        path, top = profiling.tracemalloc_snapshot(self.profile_dir)
+        return "\n".join([f"快照已写入: {path}"] + top)
+
+    def _tracemalloc_stop(self):
+        profiling.stop_tracemalloc()
+        return "tracemalloc 已停止"
@@ -0,0 +1,216 @@
+#OTC WebSocket 连接管理：后台任务持有连接，心跳检测、指数退避重连，离线时每个通道只保留最新指令。
+import asyncio
+import json
+import logging
+import random
+import websockets
+
+DISCONNECTED = "disconnected"
+CONNECTING = "connecting"
+CONNECTED = "connected"
+RECONNECTING = "reconnecting"
+CLOSED = "closed"
+
+logger = logging.getLogger(__name__)
+
+
+class OTCConnection:
+    def __init__(self, url, ping_interval=1.0, ping_timeout=1.0, min_backoff=0.05, max_backoff=1.0,
+                 connect_timeout=5.0):
+        self.url = url
+        self.ping_interval = ping_interval  # 心跳间隔，超过 ping_timeout 未收到 pong 视为断线
+        self.ping_timeout = ping_timeout
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.connect_timeout = connect_timeout
+        self.websocket = None
+        self.state = DISCONNECTED
+        self.state_listeners = []
+        self.outbox = {}  # 通道 -> 最新指令，发送前会被新指令覆盖
+        self.outbox_ready = asyncio.Event()
+        self.connected = asyncio.Event()
+        self.task = None
+        self.reconnects = 0
+        self.frames_sent = 0
+        self.pending = {}  # 消息 type -> 等待该类型回复的 future 列表
+        self.subscribers = {}  # 消息 type -> 回调列表，None 表示订阅所有消息
+        self.messages_received = 0
+        self.messages_dropped = 0  # 无人等待也无人订阅、被直接丢弃的消息
+        self.on_sent = None  # on_sent(channel)，每条指令实际写入连接后调用
+
+    def add_state_listener(self, listener):
+        """listener(state, detail) 在事件循环线程中调用"""
+        self.state_listeners.append(listener)
+
+    def _set_state(self, state, detail=""):
+        self.state = state
+        if state == CONNECTED:
+            self.connected.set()
+        else:
+            self.connected.clear()
+        for listener in self.state_listeners:
+            try:
+                listener(state, detail)
+            except Exception as e:
+                logger.error("连接状态回调出错: %s", e)
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.ensure_future(self._run())
+
+    async def wait_connected(self, timeout):
+        try:
+            await asyncio.wait_for(self.connected.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def send(self, channel, frame):
+        """非阻塞发送；未连接时保留每个通道最新的一条，重连后按顺序补发"""
+        if channel == "both":
+            # 双通道指令覆盖之前单独发给 A/B 的指令；反过来则保留，先发双通道再发单通道
+            self.outbox.pop("A", None)
+            self.outbox.pop("B", None)
+        self.outbox.pop(channel, None)
+        self.outbox[channel] = frame
+        self.outbox_ready.set()
+
+    def subscribe(self, message_type, callback):
+        """callback(data) 在收到指定 type 的消息时调用，message_type 为 None 时接收所有消息"""
+        self.subscribers.setdefault(message_type, []).append(callback)
+
+    async def request(self, payload, reply_type, timeout=3.0):
+        """发送请求并等待指定 type 的回复；并发请求各自等待，互不抢占"""
+        if self.state != CONNECTED or not self.websocket:
+            raise ConnectionError("WebSocket 未连接")
+        future = asyncio.get_running_loop().create_future()
+        waiters = self.pending.setdefault(reply_type, [])
+        waiters.append(future)
+        try:
+            await self.websocket.send(json.dumps(payload))
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            if future in waiters:
+                waiters.remove(future)
+            if not waiters:
+                self.pending.pop(reply_type, None)
+
+    def _dispatch(self, message):
+        self.messages_received += 1
+        try:
+            data = json.loads(message)
+        except (TypeError, ValueError):
+            self.messages_dropped += 1
+            return
+        message_type = data.get("type") if isinstance(data, dict) else None
+        handled = False
+        waiters = self.pending.get(message_type)
+        if waiters:
+            # 同类型的回复按请求顺序交给最早的等待者
+            while waiters and not handled:
+                future = waiters.pop(0)
+                if not future.done():
+                    future.set_result(data)
+                    handled = True
+        for key in (message_type, None):
+            for callback in self.subscribers.get(key, ()):
+                handled = True
+                try:
+                    callback(data)
+                except Exception as e:
+                    logger.error("处理 OTC 消息时出错: %s", e)
+        if not handled:
+            self.messages_dropped += 1
+
+    def _fail_pending(self, error):
+        for waiters in self.pending.values():
+            for future in waiters:
+                if not future.done():
+                    future.set_exception(error)
+        self.pending.clear()
+
+    async def close(self):
+        self._set_state(CLOSED)
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        if self.websocket:
+            await self.websocket.close()
+            self.websocket = None
+
+    async def _run(self):
+        backoff = self.min_backoff
+        first = True
+        while self.state != CLOSED:
+            self._set_state(CONNECTING if first else RECONNECTING, self.url)
+            try:
+                self.websocket = await asyncio.wait_for(
+                    websockets.connect(self.url, ping_interval=self.ping_interval, ping_timeout=self.ping_timeout),
+                    timeout=self.connect_timeout)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._set_state(DISCONNECTED, f"连接失败: {e}，{backoff:.2f}s 后重试")
+                # 指数退避并加少量随机抖动，避免与设备端同时重试
+                await asyncio.sleep(backoff * (1 + random.random() * 0.2))
+                backoff = min(backoff * 2, self.max_backoff)
+                continue
+
+            if not first:
+                self.reconnects += 1
+            first = False
+            backoff = self.min_backoff
+            self._set_state(CONNECTED, self.url)
+            try:
+                await self._pump()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._set_state(DISCONNECTED, f"连接中断: {e}")
+                self._fail_pending(ConnectionError(f"连接中断: {e}"))
+            finally:
+                websocket, self.websocket = self.websocket, None
+                if websocket:
+                    try:
+                        await websocket.close()
+                    except Exception:
+                        pass
+
+    async def _pump(self):
+        """同时运行接收和发送，任意一方结束（连接关闭）时返回"""
+        receiver = asyncio.ensure_future(self._receive())
+        sender = asyncio.ensure_future(self._send())
+        try:
+            done, _ = await asyncio.wait({receiver, sender}, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()
+            raise ConnectionError("WebSocket 已关闭")
+        finally:
+            receiver.cancel()
+            sender.cancel()
+
+    async def _receive(self):
+        """唯一的读取者：持续消费收到的消息，按 type 分发给等待中的请求和订阅者，不在缓冲区中堆积"""
+        async for message in self.websocket:
+            self._dispatch(message)
+
+    async def _send(self):
+        """发送队列中的指令"""
+        while True:
+            if not self.outbox:
+                self.outbox_ready.clear()
+                await self.outbox_ready.wait()
+            while self.outbox:
+                channel = next(iter(self.outbox))
+                frame = self.outbox[channel]
+                await self.websocket.send(frame)
+                # 发送期间同一通道可能已被更新，只有未变化时才移除
+                if self.outbox.get(channel) is frame:
+                    del self.outbox[channel]
+                self.frames_sent += 1
+                if self.on_sent:
+                    self.on_sent(channel)
@@ -1,90 +1,248 @@
 #	管理与 OTC 设备的 WebSocket 通信
 import asyncio
 import json
-import websockets
+import logging
+import math
+import time
+from collections import OrderedDict
+from otc_connection import CONNECTED, CONNECTING, CLOSED, DISCONNECTED, RECONNECTING, OTCConnection
+
+logger = logging.getLogger(__name__)
+
+TICK_SECONDS = 0.1  # 设备上每个 tick 的时长
+STATE_NAMES = {
+    CONNECTING: "正在连接",
+    CONNECTED: "已连接",
+    RECONNECTING: "正在重连",
+    DISCONNECTED: "已断开",
+    CLOSED: "已关闭"
+}
+
+
+def aligned_ticks(ticks, period):
+    """把波形时长向上取整为整数个调度周期，使保活发送正好落在波形结束处"""
+    periods = math.ceil(ticks * TICK_SECONDS / period - 1e-9)
+    return max(1, round(periods * period / TICK_SECONDS))
+
+def build_frame(pattern_name, percent, channel, ticks):
+    """构造 set_pattern 指令的 JSON 字符串，强度直接使用百分比值；双通道时 percent 可以是 (A, B) 两个百分比"""
+    if channel == "both":
+        a_percent, b_percent = percent if isinstance(percent, tuple) else (percent, percent)
+        cmd = {
+            "cmd": "set_pattern",
+            "A_pattern_name": pattern_name,
+            "B_pattern_name": pattern_name,
+            "A_intensity": a_percent,
+            "B_intensity": b_percent,
+            "A_ticks": ticks,
+            "B_ticks": ticks
+        }
+    else:
+        cmd = {
+            "cmd": "set_pattern",
+            f"{channel}_pattern_name": pattern_name,
+            f"{channel}_intensity": percent,
+            f"{channel}_ticks": ticks
+        }
+    return json.dumps(cmd)
+
+
+class FrameCache:
+    """按 (波形, 百分比或 (A, B) 百分比, 通道, ticks) 缓存序列化好的指令，LRU 淘汰；A/B 上限或 ticks 配置变化时整体失效"""
+
+    def __init__(self, capacity=512):
+        self.capacity = capacity
+        self.frames = OrderedDict()
+        self.generation = None
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, pattern_name, percent, channel, ticks, generation):
+        if generation != self.generation:
+            self.frames.clear()
+            self.generation = generation
+        key = (pattern_name, percent, channel, ticks)
+        frame = self.frames.get(key)
+        if frame is not None:
+            self.frames.move_to_end(key)
+            self.hits += 1
+            return frame
+        self.misses += 1
+        frame = build_frame(pattern_name, percent, channel, ticks)
+        self.frames[key] = frame
+        if len(self.frames) > self.capacity:
+            self.frames.popitem(last=False)
+        return frame
+
 
 class OTCController:
     def __init__(self, config):
         self.config = config
-        self.websocket = None
+        self.connection = None
+        self.state_listeners = []
+        # 发送调度状态：上一次发送的内容与时间、波形轮换位置
+        self.last_frame = None
+        self.last_send_time = None
+        self.pattern_index = 0
+        self.sent_count = 0
+        self.skipped_count = 0
+        self.frame_cache = FrameCache(config.get("frame_cache_size", 512))
+        self.latency = None  # LatencyTracker，开启后记录指令入队和发出的时间
+
+    @property
+    def websocket(self):
+        """当前可用的连接，断线重连期间为 None"""
+        if self.connection and self.connection.state == CONNECTED:
+            return self.connection.websocket
+        return None
+
+    def add_state_listener(self, listener):
+        """listener(state, detail)，连接状态变化时调用，重新连接后依然有效"""
+        self.state_listeners.append(listener)
+        if self.connection:
+            self.connection.add_state_listener(listener)
 
     async def connect(self, retries=3, delay=2, log_callback=None):
-        for attempt in range(retries):
-            msg = f"尝试连接 ({attempt + 1}/{retries}): {self.config['ws']}"
+        """启动后台连接管理，首次连接成功返回 True；之后断线会自动重连，无需再次调用"""
+        await self.disconnect()
+        url = self.config["ws"]
+        self.connection = OTCConnection(url, self.config.get("ping_interval", 1.0), self.config.get("ping_timeout", 1.0))
+
+        def log_state(state, detail):
+            msg = f"WebSocket {STATE_NAMES.get(state, state)}: {detail}" if detail else f"WebSocket {STATE_NAMES.get(state, state)}"
             if log_callback:
                 log_callback(msg)
-            print(msg)
-            try:
-                self.websocket = await asyncio.wait_for(websockets.connect(self.config["ws"]), timeout=5)
-                success_msg = "WebSocket 连接成功"
-                if log_callback:
-                    log_callback(success_msg)
-                print(success_msg)
-                return True
-            except Exception as e:
-                error_msg = f"WebSocket 连接失败: {e}"
-                if log_callback:
-                    log_callback(error_msg)
-                print(error_msg)
-                if attempt < retries - 1:
-                    await asyncio.sleep(delay)
+            logger.info(msg)
+
+        self.connection.add_state_listener(log_state)
+        self.connection.subscribe("max_intensity", self.apply_max_intensity)
+        self.connection.on_sent = self._frame_sent
+        for listener in self.state_listeners:
+            self.connection.add_state_listener(listener)
+        self.connection.start()
+        if await self.connection.wait_connected(retries * delay + self.connection.connect_timeout):
+            return True
+        await self.disconnect()
         final_msg = "所有连接尝试均失败，请检查地址或服务器状态"
         if log_callback:
             log_callback(final_msg)
-        print(final_msg)
+        logger.error(final_msg)
         return False
 
-    async def send_waveform(self, intensity, ticks, pattern_name, channel):
-        if not self.websocket:
-            print("WebSocket 未连接")
+    async def disconnect(self):
+        if self.connection:
+            connection, self.connection = self.connection, None
+            await connection.close()
+
+    async def send_percent(self, percent, ticks, pattern_name, channel):
+        if not self.connection:
+            logger.warning("WebSocket 未连接")
             return
+        # 指令字符串从缓存中取出，热路径上不再构造字典和序列化
+        frame = self.frame_cache.get(pattern_name, percent, channel, ticks,
+                                     (self.config.get("A_max"), self.config.get("B_max"), self.config["ticks"]))
+        # 交给连接管理的发送队列；断线期间只保留每个通道最新的指令
+        self.connection.send(channel, frame)
+        if self.latency is not None and self.latency.enabled:
+            self.latency.enqueued(channel)
+        logger.debug("发送指令: %s", frame)
+
+    def _frame_sent(self, channel):
+        if self.latency is not None and self.latency.enabled:
+            self.latency.sent(channel)
+
+    def channel_percent(self, intensity, channel):
+        """按通道自己的 App 上限换算为百分比，每个通道都能用满全部量程"""
+        limit = self.config.get(f"{channel}_max")
+        limit = limit if limit is not None else 30
+        return int(min((intensity / limit) * 100, 100))
+
+    def reset_schedule(self):
+        self.last_frame = None
+        self.last_send_time = None
+
+    async def schedule_waveform(self, intensities, ticks, patterns, channel, period):
+        """由周期为 period 秒的调度循环调用，按需发送波形，返回实际发送的 (强度百分比, 波形名)，未发送返回 None
 
-        app_max = self.config["app_max_intensity"]  # 使用实际获取的上限
-        intensity_percent = min((intensity / app_max) * 100, 100)  # 转换为百分比
-        actual_intensity = min(intensity, app_max)  # 实际强度，用于日志显示
+        intensities 为 {"A": 强度, "B": 强度}；双通道时两个通道的百分比放在同一条指令中发送，
+        百分比为 (A, B)
 
+        - 强度百分比上升、降到 0 或与上次发送相差达到 send_deadband 个百分点，或者选择的波形、通道、ticks
+          变化时立即发送；衰减造成的小幅下降不单独发送，随保活一起发出
+        - 波形时长向上取整为整数个调度周期，内容不变时在上一段波形结束的那个周期发送保活，并轮换到下一个波形
+        - 两次发送的间隔不小于 1 / max_send_rate 秒
+        """
+        if not self.connection:
+            return None
+        now = time.monotonic()
+        ticks = aligned_ticks(ticks, period)
         if channel == "both":
-            cmd = {
-                "cmd": "set_pattern",
-                "A_pattern_name": pattern_name,
-                "B_pattern_name": pattern_name,
-                "A_intensity": int(intensity_percent),  # 直接发送百分比值
-                "B_intensity": int(intensity_percent),
-                "A_ticks": ticks,
-                "B_ticks": ticks
-            }
+            percent = (self.channel_percent(intensities["A"], "A"), self.channel_percent(intensities["B"], "B"))
         else:
-            cmd = {
-                "cmd": "set_pattern",
-                f"{channel}_pattern_name": pattern_name,
-                f"{channel}_intensity": int(intensity_percent),  # 直接发送百分比值
-                f"{channel}_ticks": ticks
-            }
+            percent = self.channel_percent(intensities[channel], channel)
+        patterns = patterns or ["经典"]
+        frame = (percent, channel, ticks, tuple(patterns))
+        changed = self._changed(frame, self.last_frame)
+        if not changed and self.latency is not None and self.latency.enabled:
+            self.latency.discard()
 
-        await self.websocket.send(json.dumps(cmd))
-        print(f"发送指令: {cmd}, 实际强度={actual_intensity}, 百分比={intensity_percent:.1f}%, app_max={app_max}")
+        if self.last_send_time is not None:
+            elapsed = now - self.last_send_time
+            # 截止时间附近有抖动，半个周期的容差保证在波形结束的那个周期触发
+            keepalive_due = elapsed >= ticks * TICK_SECONDS - period / 2
+            if not changed and not keepalive_due:
+                return None
+            if elapsed < 1.0 / self.config.get("max_send_rate", 10):
+                # 超过最大发送速率，等下一轮再发；变化的内容不会丢失
+                self.skipped_count += 1
+                return None
+            if not changed:
+                self.pattern_index += 1
+
+        pattern_name = patterns[self.pattern_index % len(patterns)]
+        await self.send_percent(percent, ticks, pattern_name, channel)
+        self.last_frame = frame
+        self.last_send_time = now
+        self.sent_count += 1
+        return percent, pattern_name
+
+    def _changed(self, frame, last_frame):
+        if last_frame is None or frame[1:] != last_frame[1:]:
+            return True
+        percent, last_percent = frame[0], last_frame[0]
+        if not isinstance(percent, tuple):
+            percent, last_percent = (percent,), (last_percent,)
+        deadband = self.config.get("send_deadband", 5)
+        for new, old in zip(percent, last_percent):
+            # 与上次发送的值比较，小幅下降累计到 deadband 后同样立即发送
+            if new > old or (new != old and (new == 0 or old - new >= deadband)):
+                return True
+        return False
 
     async def get_max_intensity(self):
         if not self.websocket:
-            print("WebSocket 未连接")
+            logger.warning("WebSocket 未连接")
             return
 
-        request = {"cmd": "get_max_intensity"}
-        await self.websocket.send(json.dumps(request))
-        response = await self.websocket.recv()
-        data = json.loads(response)
-        if data.get("type") == "max_intensity":
-            self.config["A_max"] = data.get("A_max", 30)
-            self.config["B_max"] = data.get("B_max", 30)
-            if self.config["channel"] == "A":
-                self.config["app_max_intensity"] = self.config["A_max"]
-            elif self.config["channel"] == "B":
-                self.config["app_max_intensity"] = self.config["B_max"]
-            else:  # "both"
-                self.config["app_max_intensity"] = min(self.config["A_max"], self.config["B_max"])
-            print(f"获取到 App 上限: A_max={self.config['A_max']}, B_max={self.config['B_max']}, 选择: {self.config['app_max_intensity']}")
-        else:
-            print("未获取到有效的上限，使用默认值: A_max=30, B_max=30")
+        # 回复由接收任务按 type 分发，期间收到的其他消息不会被误当作回复
+        try:
+            await self.connection.request({"cmd": "get_max_intensity"}, "max_intensity",
+                                          self.config.get("request_timeout", 3.0))
+        except (asyncio.TimeoutError, ConnectionError) as e:
+            logger.warning("未获取到有效的上限（%s），使用默认值: A_max=30, B_max=30", str(e) or "超时")
             self.config["A_max"] = 30
             self.config["B_max"] = 30
             self.config["app_max_intensity"] = self.config["A_max"] if self.config["channel"] == "A" else self.config["B_max"]
+
+    def apply_max_intensity(self, data):
+        """处理 max_intensity 消息，无论是请求的回复还是 App 主动推送"""
+        self.config["A_max"] = data.get("A_max", 30)
+        self.config["B_max"] = data.get("B_max", 30)
+        if self.config["channel"] == "A":
+            self.config["app_max_intensity"] = self.config["A_max"]
+        elif self.config["channel"] == "B":
+            self.config["app_max_intensity"] = self.config["B_max"]
+        else:  # "both"
+            self.config["app_max_intensity"] = min(self.config["A_max"], self.config["B_max"])
+        logger.info("获取到 App 上限: A_max=%s, B_max=%s, 选择: %s",
+                    self.config["A_max"], self.config["B_max"], self.config["app_max_intensity"])
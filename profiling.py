@@ -0,0 +1,91 @@
+#运行中开启/停止性能分析：cProfile 按线程采样并写入 .prof 文件，tracemalloc 快照写入磁盘。
+import cProfile
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+logger = logging.getLogger(__name__)
+
+# 3.12 起 cProfile 基于 sys.monitoring，一个 Profile 覆盖所有线程，且同时只能开启一个
+PROCESS_WIDE = sys.version_info >= (3, 12)
+
+
+class RuntimeProfiler:
+    """开始/停止只修改标志，由日志线程和事件循环线程在各自的循环中调用 poll() 完成开启和写盘。
+    3.12 之前 cProfile 只能分析调用 enable() 的线程，每个线程各用一个 Profile；
+    之后由最先调用 poll() 的线程开启一个全进程的 Profile。poll() 不会抛出异常"""
+
+    def __init__(self, output_dir="profiles"):
+        self.output_dir = output_dir
+        self.active = False
+        self.lock = threading.Lock()
+        self.profiles = {}  # 线程名（全进程时为 "process"）-> 正在运行的 cProfile.Profile
+        self.written = []  # 已写入的文件
+        self.last_error = None
+
+    def start(self):
+        self.active = True
+
+    def stop(self):
+        self.active = False
+
+    def poll(self):
+        if not self.active and not self.profiles:
+            return
+        name = "process" if PROCESS_WIDE else threading.current_thread().name
+        with self.lock:
+            profile = self.profiles.get(name)
+            try:
+                if self.active and profile is None:
+                    profile = cProfile.Profile()
+                    profile.enable()
+                    self.profiles[name] = profile
+                    return
+                if self.active or profile is None:
+                    return
+                del self.profiles[name]
+                profile.disable()
+            except Exception as e:
+                # 例如其他分析工具已经占用了 sys.monitoring，放弃本次分析，不影响调用方的循环
+                self.active = False
+                self.last_error = e
+                logger.error("开启/停止 cProfile 失败: %s", e)
+                return
+        self._dump(name, profile)
+
+    def _dump(self, name, profile):
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            path = os.path.join(self.output_dir, f"{time.strftime('%Y%m%d_%H%M%S')}_{name}.prof")
+            profile.dump_stats(path)
+            self.written.append(path)
+            logger.info("性能分析结果已写入: %s", path)
+        except Exception as e:
+            logger.error("写入性能分析结果失败: %s", e)
+
+    def status(self):
+        return {"active": self.active, "threads": sorted(self.profiles), "written": self.written[-10:],
+                "error": str(self.last_error) if self.last_error else None}
+
+
+def start_tracemalloc(frames=10):
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+
+
+def stop_tracemalloc():
+    tracemalloc.stop()
+
+
+def tracemalloc_snapshot(output_dir="profiles", top=20):
+    """写入快照文件（可用 tracemalloc.Snapshot.load 读取），返回 (文件路径, 按行统计的前 top 项)"""
+    if not tracemalloc.is_tracing():
+        raise RuntimeError("tracemalloc 未开启")
+    snapshot = tracemalloc.take_snapshot()
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, f"{time.strftime('%Y%m%d_%H%M%S')}_memory.snapshot")
+    snapshot.dump(path)
+    return path, [str(stat) for stat in snapshot.statistics("lineno")[:top]]
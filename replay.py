@@ -0,0 +1,105 @@
+#离线回放历史战斗日志，用于调整 damage_types / reward_types 权重。
+import argparse
+import sys
+import time
+from config_manager import CONFIG_FILE, load_config
+from log_parser import ATTACK_PATTERNS, CombatLineParser
+from intensity_calculator import IntensityCalculator
+
+
+def load_replay_config(config_file=CONFIG_FILE):
+    """读取与界面、无界面运行共用的配置，未获取过上限时按 30 计算，未勾选任何类型时默认全部监控"""
+    config = load_config(config_file)
+    if config["app_max_intensity"] is None:
+        config["app_max_intensity"] = 30
+    for key in ("monitored_damage_types", "monitored_reward_types"):
+        if not config[key]:
+            config[key] = list(ATTACK_PATTERNS)
+    return config
+
+
+def read_lines(paths):
+    for path in paths:
+        with open(path, "r", encoding="utf-8-sig", errors="replace") as f:
+            yield from f
+
+
+def parse_events(lines, parser, stats):
+    """逐行解析，产出 (游戏时间, 事件)"""
+    last_ts = None
+    for line in lines:
+        stats["lines"] += 1
+        event = parser.parse(line)
+        if event:
+            if event.timestamp is not None:
+                last_ts = event.timestamp
+            yield last_ts, event
+
+
+def pace(events, speed):
+    """实时模式：按日志时间戳间隔（除以倍速）放出事件"""
+    start_wall = None
+    start_ts = None
+    for ts, event in events:
+        if ts is not None:
+            if start_ts is None:
+                start_ts, start_wall = ts, time.monotonic()
+            delay = start_wall + (ts - start_ts) / speed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        yield ts, event
+
+
+def apply_events(events, calculator, game_clock):
+    """把事件送入强度计算，产出强度时间线；时间衰减按日志中的游戏时间计算"""
+    for ts, event in events:
+        if ts is not None:
+            game_clock[0] = ts
+        calculator.add_event(event)
+        yield ts, event.type, event.subtype, calculator.current_intensity
+
+
+def replay(paths, config, output=None, realtime=False, speed=1.0):
+    stats = {"lines": 0, "events": 0}
+    parser = CombatLineParser(config)
+    game_clock = [0]
+    calculator = IntensityCalculator(config, clock=lambda: game_clock[0])
+    pipeline = parse_events(read_lines(paths), parser, stats)
+    if realtime:
+        pipeline = pace(pipeline, speed)
+    pipeline = apply_events(pipeline, calculator, game_clock)
+
+    out = open(output, "w", encoding="utf-8") if output else None
+    start = time.perf_counter()
+    try:
+        if out:
+            out.write("timestamp,type,subtype,intensity\n")
+        for ts, event_type, subtype, intensity in pipeline:
+            stats["events"] += 1
+            if out:
+                out.write(f"{'' if ts is None else ts},{event_type},{subtype},{intensity:.2f}\n")
+    finally:
+        if out:
+            out.close()
+    stats["seconds"] = time.perf_counter() - start
+    stats["lines_per_second"] = stats["lines"] / stats["seconds"] if stats["seconds"] > 0 else 0.0
+    return stats
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="回放 EVE Online 战斗日志并输出强度时间线")
+    arg_parser.add_argument("logs", nargs="+", help="一个或多个 Gamelogs 日志文件，按给定顺序回放")
+    arg_parser.add_argument("-o", "--output", help="强度时间线输出文件（CSV）")
+    arg_parser.add_argument("-c", "--config", default=CONFIG_FILE, help=f"配置文件，默认与界面共用 {CONFIG_FILE}")
+    arg_parser.add_argument("--realtime", action="store_true", help="按日志时间戳实时回放，默认尽可能快")
+    arg_parser.add_argument("--speed", type=float, default=1.0, help="实时模式下的倍速")
+    args = arg_parser.parse_args(argv)
+
+    stats = replay(args.logs, load_replay_config(args.config), args.output, args.realtime, args.speed)
+    print(f"回放完成: {stats['lines']} 行, {stats['events']} 个事件, "
+          f"耗时 {stats['seconds']:.2f}s, {stats['lines_per_second']:.0f} 行/秒", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,56 @@
+#基于单调时钟截止时间的周期调度，周期不随处理耗时漂移，错过的周期直接跳过。
+import asyncio
+import math
+import time
+
+
+class DeadlineTicker:
+    def __init__(self, rate, clock=time.monotonic):
+        if rate <= 0:
+            raise ValueError(f"调度频率必须为正数: {rate}")
+        self.period = 1.0 / rate
+        self.clock = clock
+        self.next_deadline = None
+        self.ticks = 0
+        self.missed = 0  # 因事件循环繁忙而跳过的周期数
+        # 抖动统计（实际唤醒时间 - 截止时间），Welford 算法累计均值与方差
+        self.jitter_mean = 0.0
+        self.jitter_m2 = 0.0
+        self.jitter_max = 0.0
+
+    async def wait(self):
+        """等待到下一个截止时间；已经落后整周期时跳到下一个未来的截止时间，不连续补发"""
+        now = self.clock()
+        if self.next_deadline is None:
+            self.next_deadline = now
+        else:
+            self.next_deadline += self.period
+            if now - self.next_deadline >= self.period:
+                skipped = math.floor((now - self.next_deadline) / self.period)
+                self.missed += skipped
+                self.next_deadline += skipped * self.period
+        delay = self.next_deadline - now
+        if delay > 0:
+            await asyncio.sleep(delay)
+        self._record(self.clock() - self.next_deadline)
+
+    def _record(self, jitter):
+        self.ticks += 1
+        delta = jitter - self.jitter_mean
+        self.jitter_mean += delta / self.ticks
+        self.jitter_m2 += delta * (jitter - self.jitter_mean)
+        self.jitter_max = max(self.jitter_max, jitter)
+
+    def reset(self):
+        self.next_deadline = None
+
+    def stats(self):
+        stdev = math.sqrt(self.jitter_m2 / (self.ticks - 1)) if self.ticks > 1 else 0.0
+        return {
+            "rate": 1.0 / self.period,
+            "ticks": self.ticks,
+            "missed": self.missed,
+            "jitter_mean_ms": self.jitter_mean * 1000,
+            "jitter_stdev_ms": stdev * 1000,
+            "jitter_max_ms": self.jitter_max * 1000
+        }
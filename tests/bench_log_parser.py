@@ -0,0 +1,142 @@
+#战斗日志解析的基准测试：旧的逐类型 re.search 与 CombatLineParser 的每行耗时对比，以及 7 条和 100 条规则时 RuleMatcher 的开销。
+#用法: python tests/bench_log_parser.py [--lines 20000] [--repeat 3]
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from log_parser import ATTACK_PATTERNS, CombatLineParser
+
+# 日志中实际出现的命中词，最后一段总是命中类型
+HIT_WORDS = {
+    "强力一击": ["强力一击", "Critical Hit"],
+    "命中": ["命中", "Hits"],
+    "穿透": ["穿透", "Penetrates"],
+    "擦过": ["擦过", "Glances Off"],
+    "轻轻擦过": ["轻轻擦过", "Lightly Hits"],
+    "致命一击": ["致命一击", "Wrecks"]
+}
+NAMES = ["Rat", "Blood Raider", "Guristas Kyoukan", "Serpentis - Hit Squad", "天使 - 穿透者", "Sansha's Nation"]
+WEAPONS = [None, "Heavy Missile", "Hit Weapon", "Penetrator Cannon", "Wrecking Ball", "425mm Railgun"]
+
+
+def legacy_parse_line(line, config):
+    """基线版本 EVELogMonitor.parse_line，原样保留作为对照"""
+    line = line.strip()
+    if "(combat)" not in line.lower():
+        return None
+
+    attack_patterns = {
+        "强力一击": r"(强力一击|Critical Hit)",
+        "命中": r"(命中|Hit)",
+        "穿透": r"(穿透|Penetrates)",
+        "擦过": r"(擦过|Glances)",
+        "轻轻擦过": r"(轻轻擦过|Lightly Hits)",
+        "完全没有打中你": r"(完全没有打中你|Misses Completely)",
+        "致命一击": r"(致命一击|Wrecks)"
+    }
+
+    for attack_type, pattern in attack_patterns.items():
+        match = re.search(r"<color=0xff00ffff>.*?<font size=10>对</font>.*?- " + pattern, line, re.IGNORECASE)
+        if match and attack_type in config["monitored_reward_types"]:
+            return {"type": "player_attack", "subtype": attack_type}
+
+        match = re.search(r"<color=0xffcc0000>.*?<font size=10>来自</font>.*?- " + pattern, line, re.IGNORECASE)
+        if match and attack_type in config["monitored_damage_types"]:
+            return {"type": "damage", "subtype": attack_type}
+
+    if "完全没有打中你" in line and "完全没有打中你" in config["monitored_damage_types"]:
+        return {"type": "damage", "subtype": "完全没有打中你"}
+
+    if "你的" in line and "完全没有打中" in line and "完全没有打中你" in config["monitored_reward_types"]:
+        return {"type": "player_attack", "subtype": "完全没有打中你"}
+
+    return None
+
+
+def combat_line(outgoing, amount, name, weapon, hit_word):
+    color, word = ("0xff00ffff", "对") if outgoing else ("0xffcc0000", "来自")
+    weapon_part = f" - {weapon}" if weapon else ""
+    return (f"[ 2024.05.01 12:00:00 ] (combat) <color={color}><b>{amount}</b> <color=0x77ffffff>"
+            f"<font size=10>{word}</font> <b><color=0xffffffff>{name}</b><font size=10><color=0x77ffffff>"
+            f"{weapon_part} - {hit_word}\n")
+
+
+def make_lines(count, seed=0):
+    """生成 (行, 期望的 (类型, 命中类型) 或 None)；约 70% 是战斗行，其余是 notify 等其他分类"""
+    rng = random.Random(seed)
+    lines = []
+    for _ in range(count):
+        roll = rng.random()
+        if roll < 0.7:
+            outgoing = rng.random() < 0.5
+            subtype = rng.choice(list(HIT_WORDS))
+            line = combat_line(outgoing, rng.randint(1, 2000), rng.choice(NAMES), rng.choice(WEAPONS),
+                               rng.choice(HIT_WORDS[subtype]))
+            lines.append((line, ("player_attack" if outgoing else "damage", subtype)))
+        elif roll < 0.75:
+            lines.append(("[ 2024.05.01 12:00:00 ] (combat) Rat 完全没有打中你 - Heavy Missile\n",
+                          ("damage", "完全没有打中你")))
+        else:
+            lines.append(("[ 2024.05.01 12:00:00 ] (notify) 你的跃迁引擎正在启动\n", None))
+    return lines
+
+
+def event_key(event):
+    return (str(event.type.value), str(getattr(event.subtype, "value", event.subtype))) if event else None
+
+
+def full_config():
+    return {"monitored_damage_types": list(ATTACK_PATTERNS), "monitored_reward_types": list(ATTACK_PATTERNS)}
+
+
+def make_rules(count):
+    """生成 count 条规则，一半限定 notify 分类；只有最后一条能匹配生成的 notify 行"""
+    rules = [{"name": f"规则{i}", "category": "notify" if i % 2 else None,
+              "keywords": [f"Keyword {i} alpha", f"关键字{i}"], "type": "damage", "weight": 5}
+             for i in range(count)]
+    rules[-1]["keywords"].append("跃迁引擎")
+    return rules
+
+
+def per_line_us(parse, lines, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for line in lines:
+            parse(line)
+        best = min(best, time.perf_counter() - start)
+    return best / len(lines) * 1e6
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="战斗日志解析基准测试")
+    arg_parser.add_argument("--lines", type=int, default=20000)
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    args = arg_parser.parse_args(argv)
+
+    samples = make_lines(args.lines)
+    lines = [line for line, _ in samples]
+    config = full_config()
+    parser = CombatLineParser(config)
+    legacy = per_line_us(lambda line: legacy_parse_line(line, config), lines, args.repeat)
+    combined = per_line_us(parser.parse, lines, args.repeat)
+    legacy_wrong = sum(1 for line, expected in samples
+                       if (lambda r: (r["type"], r["subtype"]) if r else None)(legacy_parse_line(line, config)) != expected)
+    wrong = sum(1 for line, expected in samples if event_key(parser.parse(line)) != expected)
+    print(f"{len(lines)} 行，全部命中类型都监控；名字或武器带命中词的行只有最后一段是命中类型")
+    print(f"  旧 parse_line:      {legacy:6.2f} us/行，与期望不符 {legacy_wrong} 行")
+    print(f"  CombatLineParser:   {combined:6.2f} us/行 ({legacy / combined:.1f}x)，与期望不符 {wrong} 行")
+    print("规则数量对 RuleMatcher 的影响（每行都检查规则）")
+    for count in (7, 100):
+        rule_parser = CombatLineParser(dict(config, rules=make_rules(count)))
+        print(f"  {count:3d} 条规则: {per_line_us(rule_parser.parse, lines, args.repeat):6.2f} us/行")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,79 @@
+#PollingDirectoryWatcher 的测试：目录修改时间不变时不扫描目录，新建文件后能发现。
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from log_index import GamelogIndex, PollingDirectoryWatcher
+
+
+class CountingIndex(GamelogIndex):
+    def __init__(self, log_dir):
+        super().__init__(log_dir, index_file=os.path.join(log_dir, "index.json"))
+        self.scans = 0
+
+    def refresh(self):
+        self.scans += 1
+        return super().refresh()
+
+
+class PollingDirectoryWatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.log_dir = tempfile.mkdtemp()
+        for name in ("20240501_120000_1.txt", "20240501_130000_2.txt"):
+            self.write(name, "Listener: A\n")
+        self.age_directory()
+        self.index = CountingIndex(self.log_dir)
+        self.index.refresh()
+        self.index.scans = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.log_dir)
+
+    def write(self, name, text):
+        with open(os.path.join(self.log_dir, name), "a", encoding="utf-8") as f:
+            f.write(text)
+
+    def age_directory(self):
+        # 把目录修改时间调到很久以前，避开刚修改过的目录每次都要扫描的窗口
+        past = 1714500000  # 2024-04-30，固定值，重复调用时修改时间不变
+        os.utime(self.log_dir, (past, past))
+
+    def test_unchanged_directory_is_not_scanned(self):
+        watcher = PollingDirectoryWatcher(self.log_dir, interval=0)
+        watcher.poll(self.index)  # 第一次总是扫描
+        self.index.scans = 0
+        for _ in range(50):
+            self.assertEqual(watcher.poll(self.index), set())
+        self.assertEqual(self.index.scans, 0)
+
+    def test_new_file_is_found(self):
+        watcher = PollingDirectoryWatcher(self.log_dir, interval=0)
+        watcher.poll(self.index)
+        self.write("20240501_140000_3.txt", "Listener: A\n")
+        self.assertEqual(watcher.poll(self.index), {"20240501_140000_3.txt"})
+        self.assertTrue(self.index.latest().endswith("20240501_140000_3.txt"))
+
+    def test_deleted_file_is_found(self):
+        watcher = PollingDirectoryWatcher(self.log_dir, interval=0)
+        watcher.poll(self.index)
+        os.remove(os.path.join(self.log_dir, "20240501_130000_2.txt"))
+        self.assertEqual(watcher.poll(self.index), {"20240501_130000_2.txt"})
+
+    def test_full_scan_fallback(self):
+        # 目录修改时间不变时，已有文件的变化只靠定期完整扫描发现
+        watcher = PollingDirectoryWatcher(self.log_dir, interval=0, full_interval=0.05)
+        watcher.poll(self.index)
+        self.write("20240501_120000_1.txt", "more\n")
+        self.age_directory()
+        self.assertEqual(watcher.poll(self.index), set())
+        time.sleep(0.06)
+        self.assertEqual(watcher.poll(self.index), {"20240501_120000_1.txt"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+#CombatLineParser 的回归测试：命中类型只取最后一段，名字或武器中的命中词不影响结果。
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_log_parser import HIT_WORDS, combat_line, full_config, legacy_parse_line, make_lines
+from events import EventType, HitQuality
+from log_parser import CombatLineParser
+
+
+class CombatLineParserTest(unittest.TestCase):
+    def setUp(self):
+        self.config = full_config()
+        self.parser = CombatLineParser(self.config)
+
+    def test_hit_word_in_weapon(self):
+        line = combat_line(True, 120, "Blood Raider", "Hit Weapon", "Critical Hit")
+        event = self.parser.parse(line)
+        self.assertEqual((event.type, event.subtype), (EventType.PLAYER_ATTACK, HitQuality.CRITICAL))
+        self.assertEqual((event.amount, event.target, event.weapon), (120, "Blood Raider", "Hit Weapon"))
+
+    def test_hit_word_in_name(self):
+        line = combat_line(False, 35, "Serpentis - Hit Squad", None, "Penetrates")
+        event = self.parser.parse(line)
+        self.assertEqual((event.type, event.subtype), (EventType.DAMAGE, HitQuality.PENETRATES))
+        self.assertEqual((event.amount, event.source, event.weapon), (35, "Serpentis - Hit Squad", None))
+
+    def test_hit_word_in_name_and_weapon(self):
+        line = combat_line(False, 7, "天使 - 穿透者", "Wrecking Ball", "轻轻擦过")
+        event = self.parser.parse(line)
+        self.assertEqual(event.subtype, HitQuality("轻轻擦过"))
+        self.assertEqual((event.source, event.weapon), ("天使 - 穿透者", "Wrecking Ball"))
+
+    def test_unmonitored_last_segment_is_not_replaced_by_earlier_word(self):
+        config = {"monitored_damage_types": ["命中"], "monitored_reward_types": []}
+        parser = CombatLineParser(config)
+        self.assertIsNone(parser.parse(combat_line(False, 50, "Serpentis - Hit Squad", None, "Glances Off")))
+        self.assertEqual(parser.parse(combat_line(False, 50, "Rat", None, "Hits")).subtype, HitQuality.HIT)
+
+    def test_miss_fallback(self):
+        event = self.parser.parse("[ 2024.05.01 12:00:00 ] (combat) Rat 完全没有打中你 - Heavy Missile\n")
+        self.assertEqual((event.type, event.subtype), (EventType.DAMAGE, HitQuality.MISS))
+
+    def test_matches_legacy_parser_when_only_last_segment_has_hit_word(self):
+        # 名字和武器不含命中词时，结果应与原来逐类型匹配的 parse_line 完全一致
+        hit_words = [word.lower() for words in HIT_WORDS.values() for word in words] + ["hit"]
+        checked = 0
+        for line, _ in make_lines(5000, seed=7):
+            segments = line.rsplit(" - ", 1)[0].lower()
+            if any(word in segments.split("</font>", 1)[-1] for word in hit_words):
+                continue
+            legacy = legacy_parse_line(line, self.config)
+            event = self.parser.parse(line)
+            self.assertEqual((legacy["type"], legacy["subtype"]) if legacy else None,
+                             (event.type.value, event.subtype.value) if event else None, line)
+            checked += 1
+        self.assertGreater(checked, 1000)
+
+    def test_generated_lines(self):
+        for line, expected in make_lines(5000, seed=3):
+            event = self.parser.parse(line)
+            self.assertEqual((event.type.value, event.subtype.value) if event else None, expected, line)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+#LineReader 的回归测试：写入方在任意字节处刷新时，不丢行、不重复，偏移最终等于文件大小。
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from log_tailer import LineReader
+
+
+def make_lines(count, seed):
+    rng = random.Random(seed)
+    words = ["命中", "Hit", "强力一击", "Critical Hit", "来自", "擦过", "Rat", "<b>123</b>", "穿透", "—"]
+    return [f"[ 2024.05.01 12:00:{i % 60:02d} ] (combat) {i} " + " ".join(rng.choice(words) for _ in range(rng.randint(0, 12)))
+            for i in range(count)]
+
+
+class LineReaderTest(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix=".txt")
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def read_all(self, writer_done, reader):
+        lines = []
+        while True:
+            done = writer_done.is_set()
+            lines.extend(reader.read_lines())
+            if done:
+                # 写入方结束后再读一次，保证读到最后一次刷新的内容
+                lines.extend(reader.read_lines())
+                return lines
+            time.sleep(0.0005)
+
+    def stress(self, chunk_size, seed):
+        expected = make_lines(5000, seed)
+        data = "".join(line + "\n" for line in expected).encode("utf-8")
+        writer_done = threading.Event()
+
+        def writer():
+            rng = random.Random(seed)
+            with open(self.path, "ab", buffering=0) as out:
+                pos = 0
+                while pos < len(data):
+                    # 在随机字节处切分，经常落在多字节字符和换行符的中间
+                    step = rng.randint(1, 2000)
+                    out.write(data[pos:pos + step])
+                    pos += step
+                    if rng.random() < 0.3:
+                        time.sleep(0.0002)
+            writer_done.set()
+
+        with open(self.path, "rb", buffering=0) as f:
+            reader = LineReader(f, chunk_size=chunk_size)
+            thread = threading.Thread(target=writer)
+            thread.start()
+            lines = self.read_all(writer_done, reader)
+            thread.join()
+            self.assertEqual(len(lines), len(expected))
+            self.assertEqual(lines, expected)
+            self.assertEqual(reader.offset, os.path.getsize(self.path))
+            self.assertFalse(reader.pending)
+
+    def test_random_flush_boundaries(self):
+        self.stress(65536, seed=1)
+
+    def test_random_flush_boundaries_small_chunks(self):
+        # 读缓冲区小于单次写入，同一次读取要跨多个缓冲区拼接
+        self.stress(64, seed=2)
+
+    def test_split_multibyte_character(self):
+        encoded = "强力一击\n".encode("utf-8")
+        with open(self.path, "rb", buffering=0) as f, open(self.path, "ab", buffering=0) as out:
+            reader = LineReader(f)
+            out.write(encoded[:2])  # "强" 的前两个字节
+            self.assertEqual(reader.read_lines(), [])
+            self.assertEqual(reader.offset, 0)
+            out.write(encoded[2:])
+            self.assertEqual(reader.read_lines(), ["强力一击"])
+            self.assertEqual(reader.offset, len(encoded))
+
+    def test_offset_starts_at_current_position(self):
+        with open(self.path, "wb") as out:
+            out.write(b"old line\n")
+        with open(self.path, "rb", buffering=0) as f, open(self.path, "ab", buffering=0) as out:
+            f.seek(0, os.SEEK_END)
+            reader = LineReader(f)
+            self.assertEqual(reader.offset, 9)
+            out.write(b"new line\npartial")
+            self.assertEqual(reader.read_lines(), ["new line"])
+            self.assertEqual(reader.offset, 18)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,129 @@
+#RuleMatcher 与前缀树正则的测试：共享前缀取最长关键字、按分类回退到不限分类的规则、格式错误的规则被跳过。
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from events import EventType
+from log_parser import CombatLineParser, RuleMatcher, keyword_pattern
+
+
+def notify(text):
+    return f"[ 2024.05.01 12:00:00 ] (notify) {text}\n"
+
+
+class KeywordPatternTest(unittest.TestCase):
+    def test_longest_match_on_shared_prefix(self):
+        pattern = keyword_pattern({"warp": "short", "warp scramble": "long", "warp disrupt": "other"})
+        self.assertEqual(pattern.search("Warp scramble attempt").lastgroup, "long")
+        self.assertEqual(pattern.search("warp disruption").lastgroup, "other")
+        self.assertEqual(pattern.search("warp drive active").lastgroup, "short")
+        self.assertIsNone(pattern.search("war"))
+
+    def test_keyword_is_prefix_of_another_in_either_order(self):
+        for keywords in ({"跃迁": "a", "跃迁扰断": "b"}, {"跃迁扰断": "b", "跃迁": "a"}):
+            pattern = keyword_pattern(keywords)
+            self.assertEqual(pattern.search("你被跃迁扰断了").lastgroup, "b")
+            self.assertEqual(pattern.search("跃迁引擎启动").lastgroup, "a")
+
+    def test_regex_metacharacters_are_escaped(self):
+        pattern = keyword_pattern({"a.b": "dot", "(x)": "paren"})
+        self.assertIsNone(pattern.search("axb"))
+        self.assertEqual(pattern.search("see a.b here").lastgroup, "dot")
+        self.assertEqual(pattern.search("(x)").lastgroup, "paren")
+
+
+class RuleMatcherTest(unittest.TestCase):
+    def test_longest_keyword_across_rules(self):
+        matcher = RuleMatcher([
+            {"name": "跃迁", "keywords": ["warp"], "type": "player_attack", "weight": 1},
+            {"name": "跃迁扰断", "keywords": ["warp scramble"], "type": "damage", "weight": 20}])
+        self.assertEqual(matcher.match(notify("Warp scramble attempt from Rat")),
+                         (EventType.DAMAGE, "跃迁扰断", 20))
+        self.assertEqual(matcher.match(notify("warp drive active")), (EventType.PLAYER_ATTACK, "跃迁", 1))
+
+    def test_category_rules_fall_back_to_uncategorized(self):
+        matcher = RuleMatcher([
+            {"name": "通用", "keywords": ["scramble", "cloak"], "weight": 5},
+            {"name": "战斗扰断", "category": "combat", "keywords": ["scramble"], "weight": 30}])
+        combat = "[ 2024.05.01 12:00:00 ] (combat) Warp scramble attempt\n"
+        self.assertEqual(matcher.match(combat), (EventType.DAMAGE, "战斗扰断", 30))
+        # 指定分类里没有的关键字回退到不限分类的规则
+        self.assertEqual(matcher.match("[ 2024.05.01 12:00:00 ] (combat) cloak\n"), (EventType.DAMAGE, "通用", 5))
+        # 其他分类只使用不限分类的规则
+        self.assertEqual(matcher.match(notify("scramble")), (EventType.DAMAGE, "通用", 5))
+        # 没有时间戳和分类头的行同样使用不限分类的规则
+        self.assertEqual(matcher.match("scramble"), (EventType.DAMAGE, "通用", 5))
+
+    def test_category_only_rules(self):
+        matcher = RuleMatcher([{"name": "提示", "category": "Notify", "keywords": ["跃迁引擎"], "weight": 3}])
+        self.assertEqual(matcher.match(notify("你的跃迁引擎正在启动")), (EventType.DAMAGE, "提示", 3))
+        self.assertIsNone(matcher.match("[ 2024.05.01 12:00:00 ] (combat) 跃迁引擎\n"))
+        self.assertIsNone(matcher.match("跃迁引擎"))
+
+    def test_category_header_is_not_matched_as_keyword(self):
+        matcher = RuleMatcher([{"name": "notify", "keywords": ["notify"]}])
+        self.assertIsNone(matcher.match(notify("nothing here")))
+
+    def test_weight_is_clamped(self):
+        matcher = RuleMatcher([{"keywords": ["a"], "weight": 500}, {"keywords": ["b"], "weight": -3}])
+        self.assertEqual(matcher.match("a")[2], 99)
+        self.assertEqual(matcher.match("b")[2], 0)
+        self.assertEqual(matcher.match("a")[1], "a")  # 没有 name 时用第一个关键字
+
+    def test_validate_rejects(self):
+        bad_rules = [
+            "跃迁",
+            {"keywords": []},
+            {"name": "缺少关键字"},
+            {"keywords": [""]},
+            {"keywords": ["ok", "  "]},
+            {"keywords": ["ok", 3]},
+            {"keywords": ["ok"], "type": "heal"},
+            {"keywords": ["ok"], "weight": "20"},
+            {"keywords": ["ok"], "weight": True},
+            {"keywords": ["ok"], "category": 1},
+        ]
+        for rule in bad_rules:
+            with self.assertRaises(ValueError, msg=rule):
+                RuleMatcher.validate(rule)
+
+    def test_bad_rules_are_skipped(self):
+        with self.assertLogs("log_parser", "WARNING") as logs:
+            matcher = RuleMatcher([
+                {"keywords": [""], "weight": 50},
+                {"name": "好规则", "keywords": "跃迁扰断", "weight": 20},
+                {"keywords": ["cloak"], "type": "heal"}])
+        self.assertEqual(len(logs.records), 2)
+        self.assertEqual(matcher.match(notify("跃迁扰断")), (EventType.DAMAGE, "好规则", 20))
+        self.assertIsNone(matcher.match(notify("cloak")))
+        self.assertIsNone(matcher.match(notify("任意一行")))
+
+
+class CombatLineParserRulesTest(unittest.TestCase):
+    def setUp(self):
+        self.config = {"monitored_damage_types": [], "monitored_reward_types": [],
+                       "rules": [{"name": "跃迁扰断", "keywords": ["跃迁扰断"], "weight": 20}]}
+        self.parser = CombatLineParser(self.config)
+
+    def test_rule_event(self):
+        event = self.parser.parse(notify("你被跃迁扰断了"))
+        self.assertEqual((event.type, event.subtype, event.weight), (EventType.DAMAGE, "跃迁扰断", 20))
+
+    def test_replacing_rules_recompiles(self):
+        self.config["rules"] = [{"name": "隐形", "keywords": ["cloak"], "type": "player_attack", "weight": 4}]
+        self.assertIsNone(self.parser.parse(notify("跃迁扰断")))
+        self.assertEqual(self.parser.parse(notify("cloak")).type, EventType.PLAYER_ATTACK)
+
+    def test_recovers_after_failed_compile(self):
+        self.config["rules"] = 5  # 不是列表，整体编译失败
+        with self.assertLogs("log_parser", "ERROR"):
+            self.assertIsNone(self.parser.parse(notify("跃迁扰断")))
+        self.assertIsNone(self.parser.parse(notify("跃迁扰断")))
+        self.config["rules"] = [{"name": "隐形", "keywords": ["cloak"], "weight": 4}]
+        self.assertEqual(self.parser.parse(notify("cloak")).subtype, "隐形")
+
+
+if __name__ == "__main__":
+    unittest.main()